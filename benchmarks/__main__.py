@@ -0,0 +1,316 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+"""
+Benchmark the bot's hot paths by driving the real handlers with fake contexts.
+Everything runs against a temporary storage directory, nothing connects to discord.
+
+    python -m benchmarks                 run everything and compare against benchmarks/baseline.json
+    python -m benchmarks --save          run everything and save the results as the new baseline
+    python -m benchmarks tag prefix      only run the benchmarks whose name contains one of the words
+"""
+import argparse
+import datetime
+import inspect
+import json
+import math
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+TEXT = ("Pycord is a modern, easy to use, feature-rich, and async ready API wrapper for Discord written in Python. "
+        "This bot is the official Pycord bot.")
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class Suite:
+    def __init__(self, only=()):
+        self.only = only
+        self.results = {}
+
+    def wanted(self, *names):
+        return not self.only or any(word in name for name in names for word in self.only)
+
+    async def run(self, name, function, iterations):
+        """Call function(i) iterations times, awaiting it if needed, and record the latency of every call."""
+        if not self.wanted(name):
+            return
+        latencies = []
+        start = time.perf_counter()
+        for i in range(iterations):
+            call_start = time.perf_counter()
+            result = function(i)
+            if inspect.isawaitable(result):
+                await result
+            latencies.append(time.perf_counter() - call_start)
+        total = time.perf_counter() - start
+        latencies.sort()
+        self.results[name] = {
+            "iterations": iterations,
+            "ops": iterations / total,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        }
+        print(f"  {name:<32}{self.results[name]['ops']:>12.0f}/s", flush=True)
+
+
+async def fill_tags(count, guilds, chunk=50_000):
+    """Insert count tags spread over guilds directly, returns their (guild, name) pairs."""
+    from tortoise.transactions import in_transaction
+    from tags import Tag
+
+    rng = random.Random(0)
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    keys = [(n % guilds, ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) + str(n))
+            for n in range(count)]
+    query = (f"INSERT INTO {Tag._meta.db_table} (guild, name, author, content, created, edited, uses) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    for offset in range(0, count, chunk):
+        rows = [[guild, name, rng.randrange(1000), f"Content of {name}", now, now, 0]
+                for guild, name in keys[offset:offset + chunk]]
+        async with in_transaction("default") as connection:
+            await connection.execute_many(query, rows)
+    return keys
+
+
+async def bench_tags(suite, bot, args):
+    from cogs.tags import autocomplete_tag
+    from tags import search_tags
+    from benchmarks.fakes import FakeAutocompleteContext, FakeContext, FakeGuild
+
+    if not suite.wanted("autocomplete", "tag search", "tag_get"):
+        return
+    print(f"Inserting {args.tags} tags...", flush=True)
+    keys = await fill_tags(args.tags, args.guilds)
+    cog = bot.get_cog("Tags")
+    await suite.run("tags warm up", lambda i: cog.warm(), 1)
+
+    rng = random.Random(1)
+    complete = autocomplete_tag()
+    prefixes = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(0, 3))) for _ in range(1000)]
+    contexts = [FakeAutocompleteContext(bot, rng.randrange(args.guilds), prefix) for prefix in prefixes]
+    await suite.run("autocomplete (index)", lambda i: complete(contexts[i % len(contexts)]), 20_000)
+    cog.index.ready = False  # the path taken while the index is still warming up
+    try:
+        await suite.run("autocomplete (database)", lambda i: complete(contexts[i % len(contexts)]), 500)
+    finally:
+        cog.index.ready = True
+
+    queries = [(rng.randrange(args.guilds), ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 4))))
+               for _ in range(1000)]
+    await suite.run("tag search", lambda i: search_tags(bot.storage.db.reader(), *queries[i % 1000]), 1000)
+
+    guilds = [FakeGuild(n) for n in range(args.guilds)]
+    contexts = [FakeContext(bot, guild) for guild in guilds]
+    hot = rng.sample(keys, 100)
+    await suite.run("tag_get (cached)",
+                    lambda i: cog.tag_get(contexts[hot[i % 100][0]], hot[i % 100][1]), 20_000)
+    cold = rng.sample(keys, 2000)
+    cog.cache.clear()
+    await suite.run("tag_get (uncached)",
+                    lambda i: cog.tag_get(contexts[cold[i][0]], cold[i][1]), len(cold))
+
+
+async def bench_storage(suite, bot, args):
+    if not suite.wanted("storage"):
+        return
+    await suite.run("storage mutation", lambda i: bot.config.__setitem__("benchmark", i), 100_000)
+
+    async def mutate_and_flush(i):
+        bot.config["benchmark"] = i
+        await bot.storage.flush()
+    await suite.run("storage flush", mutate_and_flush, 50)
+
+
+async def bench_prefix(suite, bot, args):
+    from tools import get_prefix
+    from benchmarks.fakes import FakeGuild, FakeMessage
+
+    if not suite.wanted("get_prefix"):
+        return
+    for guild_id in range(0, 1000, 10):  # some guilds with custom prefixes
+        bot.prefixes.set(guild_id, ["!", "?"])
+    messages = [FakeMessage(FakeGuild(n)) for n in range(1000)] + [FakeMessage() for _ in range(100)]
+    await suite.run("get_prefix", lambda i: get_prefix(bot, messages[i % len(messages)]), 200_000)
+
+
+async def bench_joinpos(suite, bot, args):
+    import main
+    from benchmarks.fakes import FakeContext, fake_guild
+
+    if not suite.wanted("join"):
+        return
+    guild = fake_guild(1, args.members)
+    await suite.run("member tables load", lambda i: bot.member_tables.load(guild, guild.members), 5)
+    ctx = FakeContext(bot, guild)
+    rng = random.Random(2)
+    members = rng.choices(guild.members, k=1000)
+    await suite.run("_joinpos", lambda i: main._joinpos.callback(ctx, members[i % 1000]), 20_000)
+
+
+async def bench_send_code(suite, bot, args):
+    from tools import send_code
+    from benchmarks.fakes import FakeContext
+
+    ctx = FakeContext(bot)
+    for label, size, iterations in (("100B", 100, 20_000), ("10KB", 10_000, 2000),
+                                    ("1MB", 1_000_000, 50), ("4MB", 4_000_000, 10)):
+        code = (TEXT * (size // len(TEXT) + 1))[:size]
+        await suite.run(f"send_code {label}", lambda i: send_code(ctx, code, lang="txt"), iterations)
+
+
+async def bench_bf(suite, bot, args):
+    import bf
+    import main
+    from benchmarks.fakes import FakeContext
+
+    if not suite.wanted("bf"):
+        return
+    ctx = FakeContext(bot)
+    code = bf.encode(TEXT)
+    await suite.run("bf encode", lambda i: main.encode.callback(ctx, TEXT), 20)
+    await suite.run("bf compile", lambda i: main._compile.callback(ctx, code), 50)
+    await suite.run("bf decode", lambda i: main.decode.callback(ctx, code), 50)
+
+
+async def bench_ratelimit(suite, bot, args):
+    if not suite.wanted("rate limit"):
+        return
+    bot.config["ratelimits"] = {}  # the default limits
+    try:
+        limiter = bot.rate_limiter
+        await suite.run("rate limit (one user)", lambda i: limiter.hit("source", 1, 1), 100_000)
+        rng = random.Random(3)
+        users = [rng.randrange(1_000_000) for _ in range(10_000)]
+        await suite.run("rate limit (many users)",
+                        lambda i: limiter.hit("tag autocomplete", users[i % 10_000], i % 100), 200_000)
+    finally:
+        disable_rate_limits(bot)
+
+
+def disable_rate_limits(bot):
+    # the other benchmarks call the same handlers over and over, which would only measure the rejections
+    bot.config["ratelimits"] = {command: None for command in bot.rate_limiter.defaults}
+
+
+BENCHMARKS = (bench_tags, bench_storage, bench_prefix, bench_joinpos, bench_send_code, bench_bf, bench_ratelimit)
+
+
+async def run(suite, args):
+    import main
+    from benchmarks.fakes import FakeUser
+
+    bot = main.bot
+    bot._connection.user = FakeUser(42)  # get_prefix mentions the bot
+    disable_rate_limits(bot)
+    # raise the load error instead of storing it, the tag benchmarks can't run without the cog
+    bot.load_extension("cogs.tags", store=False)  # before the database is ready, so that only bench_tags warms it up
+    await bot.storage.db.init()
+    try:
+        for benchmark in BENCHMARKS:
+            await benchmark(suite, bot, args)
+    finally:
+        cog = bot.get_cog("Tags")
+        if cog is not None:
+            cog.flush_usage.cancel()  # the usage is flushed by prepare_shutdown, the loop would be left pending
+        await bot.prepare_shutdown()
+
+
+def compare(results, baseline, tolerance):
+    """Print the results next to the baseline, returns the names of the benchmarks that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<32}{'ops/s':>12}{'p50':>11}{'p95':>11}{'p99':>11}{'vs baseline':>14}")
+    for name, result in results.items():
+        line = (f"{name:<32}{result['ops']:>12.0f}{result['p50'] * 1e6:>9.1f}us"
+                f"{result['p95'] * 1e6:>9.1f}us{result['p99'] * 1e6:>9.1f}us")
+        base = baseline.get(name)
+        if base is not None:
+            change = result['p50'] / base['p50'] - 1 if base['p50'] else 0.0
+            slower = max(change, result['p95'] / base['p95'] - 1 if base['p95'] else 0.0)
+            line += f"{change:>+13.0%}"
+            if slower > tolerance:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("only", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--tags", type=int, default=1_000_000, help="number of tags in the database")
+    parser.add_argument("--guilds", type=int, default=10, help="number of guilds the tags are spread over")
+    parser.add_argument("--members", type=int, default=100_000, help="members in the join position guild")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to compare against or save to")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="how much slower p50 or p95 may get before it counts as a regression")
+    args = parser.parse_args()
+
+    parameters = [args.tags, args.guilds, args.members]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved.get("parameters") != parameters:
+            print("The baseline was recorded with different parameters, not comparing against it")
+        else:
+            baseline = saved["results"]
+
+    # the bot keeps its storage in the working directory
+    sys.path.insert(0, PROJECT_DIR)
+    directory = tempfile.mkdtemp(prefix="robocord-benchmarks-")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    suite = Suite(args.only)
+    try:
+        import main as bot_main
+        bot_main.bot.loop.run_until_complete(run(suite, args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    regressions = compare(suite.results, baseline, args.tolerance)
+    if args.save:
+        # benchmarks that weren't run this time keep their previous results
+        with open(args.baseline, "w") as f:
+            json.dump({"parameters": parameters, "results": {**baseline, **suite.results}}, f, indent=2)
+        print(f"\nSaved the baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
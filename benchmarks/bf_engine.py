@@ -0,0 +1,107 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+"""
+Compare the in-project brainfuck engine and encoder against bftools, which only the benchmarks depend on.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bf_engine
+"""
+import sys
+import timeit
+
+import bftools
+
+import bf
+
+TEXT = ("Pycord is a modern, easy to use, feature-rich, and async ready API wrapper for Discord written in Python. "
+        "This bot is the official Pycord bot.")
+
+# bftools doesn't wrap cells, so every program keeps them within 0-255
+PROGRAMS = {
+    "hello world": "++++++++[>++++[>++>+++>+++>+<<<<-]>+>+>->>+[<]<-]>>.>---.+++++++..+++.>>.<-.<.+++.------.--------.>>+.>++.",
+    # three nested counters, the innermost loop is a multiply loop
+    "nested multiply": "+" * 5 + "[>" + "+" * 5 + "[>" + "+" * 4 + "[>++>+<<-]<-]<-]>>>.>.",
+    # a loop that can't be turned into a single instruction, it moves a value back and forth
+    "copy back and forth": "+" * 15 + "[>" + "+" * 15 + "[>" + "+" * 255 + "[>+<-]>[<+>-]<[-]<-]<-]>>>" + "+" * 65 + ".",
+    "clear and scan": ">" + ("+" * 20 + ">") * 200 + "<[<]>[[-]>]" + "+" * 33 + ".",
+}
+
+
+def best_of(function, repeat=5):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def guarded(function):
+    """
+    Call a bftools function, None if it fails. Its decoder runs the compiled program with the standard streams
+    redirected and doesn't put them back when the program raises, so they are restored here.
+    """
+    stdout, stderr = sys.stdout, sys.stderr
+    try:
+        return function()
+    except Exception:
+        return None
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+def main():
+    tools = bftools.BrainfuckTools()
+    programs = dict(PROGRAMS, **{"encoded text": str(tools.encode(TEXT))})
+
+    print(f"{'program':<22}{'bftools decode':>16}{'bf decode':>12}{'speedup':>10}"
+          f"{'bftools compile':>18}{'bf compile':>13}{'python size':>14}")
+    for name, code in programs.items():
+        expected = guarded(lambda: str(tools.decode(code)))
+        output = bf.run(code)
+        assert expected is None or output == expected, f"{name}: output differs from bftools"
+        compiled = guarded(lambda: str(tools.compile(code)))
+
+        decode = best_of(lambda: bf.run(code))
+        compile_ = best_of(lambda: bf.to_python(bf.optimize(code)))
+        size = len(bf.to_python(bf.optimize(code)))
+        if expected is None:
+            columns = f"{'n/a':>16}{decode * 1000:>10.2f}ms{'n/a':>10}"
+        else:
+            decode_reference = best_of(lambda: tools.decode(code))
+            columns = f"{decode_reference * 1000:>14.2f}ms{decode * 1000:>10.2f}ms{decode_reference / decode:>9.1f}x"
+        if compiled is None:
+            columns += f"{'n/a':>18}{compile_ * 1000:>11.2f}ms{f'n/a/{size}':>14}"
+        else:
+            compile_reference = best_of(lambda: tools.compile(code))
+            columns += (f"{compile_reference * 1000:>16.2f}ms{compile_ * 1000:>11.2f}ms"
+                        f"{f'{len(compiled)}/{size}':>14}")
+        print(f"{name:<22}{columns}", flush=True)
+
+    print(f"\n{'encoded text':<22}{'bftools':>10}{'bf':>10}")
+    for text in ("Hello, World!", TEXT):
+        encoded = bf.encode(text)
+        assert bf.run(encoded) == text
+        print(f"{len(text):>4} characters{len(str(tools.encode(text))):>18}{len(encoded):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+# Just enough of discord's objects for the handlers to run without a connection
+import datetime
+
+
+class FakePermissions:
+    def __init__(self, manage_messages=False):
+        self.manage_messages = manage_messages
+
+
+class FakeRole:
+    def __init__(self, id, default=False):
+        self.id = id
+        self.default = default
+
+    def is_default(self):
+        return self.default
+
+
+class FakeUser:
+    def __init__(self, id, guild=None, joined_at=None, roles=()):
+        self.id = id
+        self.guild = guild
+        self.joined_at = joined_at
+        self.roles = list(roles)
+        self.mention = f"<@{id}>"
+        self.guild_permissions = FakePermissions()
+
+
+class FakeGuild:
+    def __init__(self, id, name="Benchmark", members=()):
+        self.id = id
+        self.name = name
+        self.members = list(members)
+
+
+def fake_guild(id, member_count, start=datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)):
+    """A guild with members that joined a minute apart, every third one with a role."""
+    guild = FakeGuild(id)
+    everyone, role = FakeRole(id, default=True), FakeRole(id + 1)
+    guild.members = [FakeUser(id * 10_000_000 + n, guild, start + datetime.timedelta(minutes=n),
+                              (everyone, role) if n % 3 == 0 else (everyone,))
+                     for n in range(member_count)]
+    return guild
+
+
+class FakeMessage:
+    def __init__(self, guild=None, content=""):
+        self.guild = guild
+        self.content = content
+
+
+class FakeInteraction:
+    def __init__(self, guild_id, user):
+        self.guild_id = guild_id
+        self.guild = None
+        self.user = user
+
+
+class FakeAutocompleteContext:
+    def __init__(self, bot, guild_id, value, user=None):
+        self.bot = bot
+        self.value = value
+        self.interaction = FakeInteraction(guild_id, user or FakeUser(1))
+
+
+class FakeContext:
+    """Stands in for an ApplicationContext, keeping the last response instead of sending it."""
+    def __init__(self, bot, guild=None, author=None):
+        self.bot = bot
+        self.guild = guild
+        self.author = author or FakeUser(1, guild)
+        self.responses = 0
+        self.response = None
+
+    async def respond(self, content=None, **kwargs):
+        self.responses += 1
+        self.response = (content, kwargs)
+
+    async def defer(self):
+        pass
+
+    async def edit(self, content=None, **kwargs):
+        self.response = (content, kwargs)
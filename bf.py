@@ -0,0 +1,525 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import asyncio
+import concurrent.futures
+import heapq
+import multiprocessing
+import operator
+import os
+import signal
+import time
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+TAPE_SIZE = 30000
+
+
+class BrainfuckError(Exception):
+    pass
+
+
+class StepLimitExceeded(BrainfuckError):
+    pass
+
+
+class TimeLimitExceeded(BrainfuckError):
+    pass
+
+
+class OutputLimitExceeded(BrainfuckError):
+    pass
+
+
+class QueueFull(BrainfuckError):
+    pass
+
+
+# Opcodes of the optimized program, see optimize()
+ADD, MOVE, OPEN, CLOSE, OUT, IN, SET, MUL, SCAN = range(9)
+
+
+class Program:
+    """An optimized brainfuck program: parallel lists of opcodes and their arguments."""
+    __slots__ = ('ops', 'args')
+
+    def __init__(self, ops, args):
+        self.ops = ops
+        self.args = args
+
+    def __len__(self):
+        return len(self.ops)
+
+
+def _check_brackets(code):
+    depth = 0
+    for index, char in enumerate(code):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            if depth < 0:
+                raise BrainfuckError(f"Unmatched ] at character {index}")
+    if depth:
+        raise BrainfuckError("Unmatched [")
+
+
+def _skip_loop(code, index):
+    """Return the index of the ] matching the [ at index."""
+    depth = 0
+    for index in range(index, len(code)):
+        if code[index] == '[':
+            depth += 1
+        elif code[index] == ']':
+            depth -= 1
+            if not depth:
+                return index
+
+
+def _simplify_loop(body):
+    """Replace a loop made only of +-<> by a single instruction where possible, otherwise return None."""
+    if len(body) == 1 and body[0][0] == MOVE:
+        return SCAN, body[0][1]
+    offset = 0
+    deltas = {}
+    for op, arg in body:
+        if op == ADD:
+            deltas[offset] = (deltas.get(offset, 0) + arg) & 255
+        elif op == MOVE:
+            offset += arg
+        else:
+            return None
+    if offset != 0 or deltas.get(0) not in (1, 255):
+        return None
+    # the loop runs cell / -cell times depending on the direction the counter moves in
+    direction = -1 if deltas.pop(0) == 1 else 1
+    targets = tuple((target, (delta * direction) & 255) for target, delta in sorted(deltas.items()) if delta)
+    if not targets:
+        return SET, 0
+    return MUL, (targets, min(targets)[0], max(targets)[0])
+
+
+def optimize(code):
+    """
+    Translate brainfuck into a Program.
+    Runs of +- and <> are folded, [-] style loops become SET, copy and multiply loops become MUL,
+    [>] style loops become SCAN, loops that can never run are dropped and jump targets are precomputed.
+    """
+    _check_brackets(code)
+    ops = []  # (opcode, argument) pairs, jump targets are filled in at the end
+    opens = []
+    index = 0
+    while index < len(code):
+        char = code[index]
+        last = ops[-1] if ops else None
+        if char in '+-':
+            value = 1 if char == '+' else 255
+            if last and last[0] in (ADD, SET):
+                value = (last[1] + value) & 255
+                ops.pop()
+                if last[0] == SET:
+                    ops.append((SET, value))
+                elif value:
+                    ops.append((ADD, value))
+            else:
+                ops.append((ADD, value))
+        elif char in '<>':
+            value = 1 if char == '>' else -1
+            if last and last[0] == MOVE:
+                ops.pop()
+                value += last[1]
+                if value:
+                    ops.append((MOVE, value))
+            else:
+                ops.append((MOVE, value))
+        elif char == '[':
+            if last is None or last[0] in (CLOSE, SCAN, MUL) or last == (SET, 0):
+                # the current cell is known to be zero, so the loop never runs
+                index = _skip_loop(code, index)
+            else:
+                opens.append(len(ops))
+                ops.append((OPEN, None))
+        elif char == ']':
+            start = opens.pop()
+            simplified = _simplify_loop(ops[start + 1:])
+            if simplified is None:
+                ops.append((CLOSE, None))
+            else:
+                del ops[start:]
+                if simplified[0] == SET and ops and ops[-1][0] == ADD:
+                    ops.pop()  # adding to a cell right before clearing it does nothing
+                ops.append(simplified)
+        elif char == '.':
+            ops.append((OUT, None))
+        elif char == ',':
+            ops.append((IN, None))
+        index += 1
+
+    args = [arg for _, arg in ops]
+    stack = []
+    for position, (op, _) in enumerate(ops):
+        if op == OPEN:
+            stack.append(position)
+        elif op == CLOSE:
+            start = stack.pop()
+            args[start] = position
+            args[position] = start
+    return Program([op for op, _ in ops], args)
+
+
+def execute(program, max_steps=None, max_output=None):
+    """Run an optimized program and return its output, stopping once it executes more than max_steps operations."""
+    ops = program.ops
+    args = program.args
+    tape = bytearray(TAPE_SIZE)
+    output = bytearray()
+    end = len(ops)
+    budget = max_steps + 1 if max_steps is not None else -1
+    pointer = pc = 0
+    while pc < end:
+        budget -= 1
+        if not budget:
+            raise StepLimitExceeded(f"Program ran for more than {max_steps} steps")
+        op = ops[pc]
+        if op == ADD:
+            tape[pointer] = (tape[pointer] + args[pc]) & 255
+        elif op == MOVE:
+            pointer += args[pc]
+            if not 0 <= pointer < TAPE_SIZE:
+                raise BrainfuckError("Pointer moved off the tape")
+        elif op == CLOSE:
+            if tape[pointer]:
+                pc = args[pc]
+        elif op == OPEN:
+            if not tape[pointer]:
+                pc = args[pc]
+        elif op == MUL:
+            value = tape[pointer]
+            if value:
+                targets, low, high = args[pc]
+                if pointer + low < 0 or pointer + high >= TAPE_SIZE:
+                    raise BrainfuckError("Pointer moved off the tape")
+                for offset, factor in targets:
+                    tape[pointer + offset] = (tape[pointer + offset] + value * factor) & 255
+                tape[pointer] = 0
+        elif op == SET:
+            tape[pointer] = args[pc]
+        elif op == SCAN:
+            step = args[pc]
+            try:
+                if step == 1:
+                    pointer = tape.index(0, pointer)
+                elif step == -1:
+                    pointer = tape.rindex(0, 0, pointer + 1)
+                else:
+                    while tape[pointer]:
+                        pointer += step
+                        if pointer < 0:
+                            raise IndexError
+            except (ValueError, IndexError):
+                raise BrainfuckError("Pointer moved off the tape")
+        elif op == OUT:
+            output.append(tape[pointer])
+            if max_output is not None and len(output) > max_output:
+                raise OutputLimitExceeded(f"Program printed more than {max_output} characters")
+        elif op == IN:
+            tape[pointer] = 0  # there is no input
+        pc += 1
+    try:
+        return output.decode('utf-8')
+    except UnicodeDecodeError:
+        return output.decode('latin-1')
+
+
+def run(code, max_steps=None, max_output=None):
+    """Run brainfuck code and return its output."""
+    return execute(optimize(code), max_steps=max_steps, max_output=max_output)
+
+
+def to_python(program):
+    """Generate a readable python equivalent of an optimized program."""
+    lines = []
+    uses_input = IN in program.ops
+    if uses_input:
+        lines.append("import sys")
+    lines += [f"tape = bytearray({TAPE_SIZE})", "p = 0"]
+    indent = ""
+
+    def cell(offset=0):
+        return f"tape[p + {offset}]" if offset > 0 else f"tape[p - {-offset}]" if offset else "tape[p]"
+
+    for op, arg in zip(program.ops, program.args):
+        if op == ADD:
+            line = f"{cell()} = ({cell()} + {arg}) & 255" if arg < 128 else f"{cell()} = ({cell()} - {256 - arg}) & 255"
+        elif op == MOVE:
+            line = f"p += {arg}" if arg > 0 else f"p -= {-arg}"
+        elif op == OPEN:
+            lines.append(f"{indent}while {cell()}:")
+            indent += "    "
+            continue
+        elif op == CLOSE:
+            if lines[-1].endswith(':'):
+                lines.append(indent + "pass")
+            indent = indent[:-4]
+            continue
+        elif op == SET:
+            line = f"{cell()} = {arg}"
+        elif op == MUL:
+            for offset, factor in arg[0]:
+                term = cell() if factor == 1 else f"{cell()} * {factor}"
+                lines.append(f"{indent}{cell(offset)} = ({cell(offset)} + {term}) & 255")
+            line = f"{cell()} = 0"
+        elif op == SCAN:
+            line = f"while {cell()}: p {'+' if arg > 0 else '-'}= {abs(arg)}"
+        elif op == OUT:
+            line = f"print(chr({cell()}), end='')"
+        else:
+            line = f"{cell()} = ord(sys.stdin.read(1) or '\\0')"
+        lines.append(indent + line)
+    return '\n'.join(lines) + '\n'
+
+
+def _multiply_table():
+    """For every value, the cheapest (counter, factor, remainder) to add it with a multiply loop."""
+    table = [None] * 256
+    for counter in range(2, 17):
+        for factor in range(-32, 33):
+            if not factor:
+                continue
+            for remainder in range(-8, 9):
+                value = (counter * factor + remainder) & 255
+                cost = counter + abs(factor) + abs(remainder) + 3  # [, - and ]
+                if table[value] is None or cost < table[value][0]:
+                    table[value] = (cost, counter, factor, remainder)
+    return table
+
+
+_MULTIPLY = _multiply_table()
+
+
+def _moves(distance):
+    return '>' * distance if distance > 0 else '<' * -distance
+
+
+def _adds(amount):
+    amount &= 255
+    return '+' * amount if amount <= 128 else '-' * (256 - amount)
+
+
+def _candidates(pointer, cells, target):
+    """Every way of getting target into a cell and printing it, as (cost, pointer, cells, code) tuples."""
+    for index in range(1, len(cells)):
+        delta = (target - cells[index]) & 255
+        new_cells = cells[:index] + (target,) + cells[index + 1:]
+        direct = abs(index - pointer) + min(delta, 256 - delta) + 1
+        yield direct, index, new_cells, lambda p=pointer, i=index, d=delta: _moves(i - p) + _adds(d) + '.'
+        multiply = pointer + _MULTIPLY[delta][0] + 3 * index + 1 if delta else direct
+        if multiply < direct:
+            # cell 0 is kept free as the loop counter
+            yield multiply, index, new_cells, lambda p=pointer, i=index, d=delta: (
+                _moves(-p) + _adds(_MULTIPLY[d][1]) + '[' + _moves(i) + _adds(_MULTIPLY[d][2]) + _moves(-i)
+                + '-]' + _moves(i) + _adds(_MULTIPLY[d][3]) + '.')
+
+
+def encode(text, effort=32, time_budget=1.0, cells=6):
+    """
+    Generate a short brainfuck program that prints text.
+    Characters are produced by adjusting whichever of a few working cells is cheapest to reach,
+    either directly or with a multiply loop, and a beam search of width effort picks the shortest sequence.
+    Once time_budget seconds have passed the search continues greedily.
+    """
+    deadline = time.perf_counter() + time_budget
+    # each state is (cost, pointer, cells, parent, code builder)
+    beam = [(0, 0, (0,) * (cells + 1), None, None)]
+    for byte in text.encode('utf-8'):
+        width = effort if time.perf_counter() < deadline else 1
+        expanded = {}
+        for state in beam:
+            cost, pointer, values = state[0], state[1], state[2]
+            for extra, new_pointer, new_values, code in _candidates(pointer, values, byte):
+                key = (new_pointer, new_values)
+                if key not in expanded or cost + extra < expanded[key][0]:
+                    expanded[key] = (cost + extra, new_pointer, new_values, state, code)
+        beam = heapq.nsmallest(width, expanded.values(), key=operator.itemgetter(0))
+    pieces = []
+    state = beam[0]
+    while state[3] is not None:
+        pieces.append(state[4]())
+        state = state[3]
+    return ''.join(reversed(pieces))
+
+
+def _current_address_space():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _init_worker(memory_limit):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # leave ctrl+c to the bot
+    if resource is not None and memory_limit:
+        # workers are forked from the fork server, so the cap is on top of what they already inherited
+        current = _current_address_space()
+        if current is not None:
+            limit = current + memory_limit
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _alarm(signum, frame):
+    raise TimeLimitExceeded("Program took too long to run")
+
+
+def _job(kind, argument, time_limit, options):
+    if hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        if kind == 'decode':
+            return run(argument, max_steps=options['max_steps'], max_output=options['max_output'])
+        if kind == 'compile':
+            return to_python(optimize(argument))
+        if kind == 'encode':
+            # leave some of the time limit for building the program once the search is over
+            return encode(argument, effort=options['effort'], time_budget=min(options['time_budget'], time_limit / 2))
+        raise ValueError(f"Unknown job kind {kind!r}")
+    except MemoryError:
+        raise BrainfuckError("Program used too much memory")
+    finally:
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class BrainfuckExecutor:
+    """
+    Runs brainfuck jobs in a bounded pool of worker processes, so user programs can't block the event loop.
+    At most ``workers`` jobs run at once and ``queue_size`` more may wait, anything beyond that is rejected.
+    Every job is limited in wall-clock time, steps, output size and memory.
+    """
+    def __init__(self, workers=2, queue_size=8, time_limit=5.0, max_steps=20_000_000, max_output=100_000,
+                 memory_limit=256 * 1024 * 1024, encode_effort=32, encode_time_budget=1.0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.time_limit = time_limit
+        self.max_steps = max_steps
+        self.max_output = max_output
+        self.encode_effort = encode_effort
+        self.encode_time_budget = encode_time_budget
+        self.memory_limit = memory_limit
+        self._pool = None
+        self._slots = None
+        self._jobs = 0  # running and waiting
+
+    def _get_pool(self):
+        if self._pool is None:
+            try:
+                # forking the bot itself could copy a lock held by one of its threads into the worker,
+                # the fork server is a separate single threaded process that imports main.py once
+                context = multiprocessing.get_context('forkserver')
+            except ValueError:
+                context = multiprocessing.get_context()
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context,
+                initializer=_init_worker, initargs=(self.memory_limit,)
+            )
+        return self._pool
+
+    def _kill_pool(self, pool=None):
+        """Kill a pool's workers, only if it is still the current pool: an old one was killed when it was replaced."""
+        if pool is None:
+            pool = self._pool
+        if pool is None or pool is not self._pool:
+            return
+        self._pool = None
+        # ProcessPoolExecutor can't cancel running jobs, so the workers have to go
+        for process in list(pool._processes.values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def start(self):
+        """Start a worker ahead of the first job, the fork server has to import the bot before it can fork any."""
+        pool = self._get_pool()
+        await asyncio.get_running_loop().run_in_executor(None, lambda: pool.submit(os.getpid).result())
+
+    @property
+    def load(self):
+        return self._jobs
+
+    async def submit(self, kind, argument, **options):
+        if self._jobs >= self.workers + self.queue_size:
+            raise QueueFull("Too many brainfuck programs are running right now, try again later")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        options = dict({
+            'max_steps': self.max_steps,
+            'max_output': self.max_output,
+            'effort': self.encode_effort,
+            'time_budget': self.encode_time_budget,
+        }, **{key: value for key, value in options.items() if value is not None})
+        self._jobs += 1
+        try:
+            async with self._slots:
+                for attempt in range(2):
+                    pool = self._get_pool()
+                    future = asyncio.get_running_loop().run_in_executor(
+                        pool, _job, kind, argument, self.time_limit, options
+                    )
+                    try:
+                        # the worker raises TimeLimitExceeded itself, this only catches workers that are stuck
+                        return await asyncio.wait_for(future, self.time_limit + 1)
+                    except asyncio.TimeoutError:
+                        self._kill_pool(pool)
+                        raise TimeLimitExceeded("Program took too long to run")
+                    except concurrent.futures.process.BrokenProcessPool:
+                        # every job on a pool breaks with it, whichever one killed or crashed it,
+                        # so each runs once more on a new pool and only a program that breaks that one too is blamed
+                        self._kill_pool(pool)
+                raise BrainfuckError("Program crashed the worker running it")
+        finally:
+            self._jobs -= 1
+
+    async def encode(self, text, effort=None):
+        return await self.submit('encode', text, effort=effort)
+
+    async def compile(self, code):
+        return await self.submit('compile', code)
+
+    async def decode(self, code):
+        return await self.submit('decode', code)
+
+    async def shutdown(self):
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        waiting = asyncio.get_running_loop().run_in_executor(None, lambda: pool.shutdown(wait=True, cancel_futures=True))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiting), self.time_limit + 1)
+        except asyncio.TimeoutError:
+            # a stuck job, the pool finishes shutting down once its worker is gone
+            for process in list((pool._processes or {}).values()):
+                process.kill()
+            await waiting
@@ -30,6 +30,8 @@ import logging
 from discord.ext import commands
 from jishaku.codeblocks import codeblock_converter
 
+from tools import codeblock, codefile
+
 
 class Owner(commands.Cog):
 
@@ -39,26 +41,39 @@ class Owner(commands.Cog):
     @commands.command(name='eval')
     async def _eval(self, ctx, *, code: codeblock_converter):
         """Eval some code"""
+        self.bot.ensure_extension('jishaku')
         cog = self.bot.get_cog("Jishaku")
         await cog.jsk_python(ctx, argument=code)
 
     @commands.command(name='refresh')
     async def _refresh(self, ctx):
-        """Refresh the bot by invoking `jsk git pull` and `restart`"""
+        """
+        Refresh the bot by invoking `jsk git pull`, then reload the changed cogs,
+        or `restart` if anything else changed
+        """
+        self.bot.ensure_extension('jishaku')
         cog = self.bot.get_cog("Jishaku")
         await cog.jsk_git(ctx, argument=codeblock_converter('pull'))
         await asyncio.sleep(2)  # allow jsk git pull to finish
-        restart = self.bot.get_command('restart')
-        await ctx.invoke(restart)
+        results, modules = self.bot.reloader.reload_changed()
+        if modules:
+            await ctx.send(f"{', '.join(modules)} changed, restarting")
+            restart = self.bot.get_command('restart')
+            return await ctx.invoke(restart)
+        await ctx.send(self.bot.reloader.format(results) or "No cogs changed")
 
     @commands.command(name='restart')
-    async def _restart(self, ctx):
+    async def _restart(self, ctx, resume: bool = True):
         """
-        Restart the bot.
+        Restart the bot, resuming the gateway session in the new process unless told not to.
         """
         self.bot.cache['restart_channel'] = ctx.channel.id
         if sys.stdin.isatty():
             await ctx.send("Logging out now...")
+            await self.bot.prepare_shutdown()
+            if resume:
+                # the connection isn't closed, so the session stays valid for the new process
+                self.bot.save_session()
             try:
                 p = psutil.Process(os.getpid())
                 for handler in p.open_files() + p.connections():
@@ -67,6 +82,7 @@ class Owner(commands.Cog):
                 logging.error(e)
             python = sys.executable
             os.execl(python, python, *sys.argv)
+        self.bot.ensure_extension('jishaku')
         cog = self.bot.get_cog("Jishaku")
         await cog.jsk_shutdown(ctx)
         embed = ctx.error('Failed to restart')
@@ -94,6 +110,39 @@ class Owner(commands.Cog):
         context = await ctx.bot.get_context(message)
         await context.reinvoke()
 
+    @commands.command(name='stalls')
+    async def _stalls(self, ctx, clear: bool = False):
+        """
+        Show where the event loop has been blocked, optionally clearing the report
+        """
+        report = self.bot.watchdog.report()
+        if clear:
+            self.bot.watchdog.clear()
+        if not report:
+            return await ctx.send("The event loop hasn't stalled")
+        lines = [f"{'stalls':>6}{'total':>9}{'longest':>9}  call site"]
+        for site, stall in report:
+            lines.append(f"{stall.count:>6}{stall.total:>8.2f}s{stall.longest:>8.2f}s  {site}")
+        worst_site, worst = report[0]
+        text = '\n'.join(lines) + f"\n\nStack captured at {worst_site}:\n{worst.stack}"
+        if len(text) < 1900:
+            await ctx.send(codeblock(text, lang="txt"))
+        else:
+            await ctx.send(file=codefile(text, filename="stalls.txt"))
+
+    @commands.command(name='startup')
+    async def _startup(self, ctx):
+        """
+        Show how long each phase of startup took
+        """
+        text = self.bot.startup.report()
+        if self.bot.startup.profiler is not None:
+            text += "\n\n" + self.bot.startup.profiler.report(limit=15)
+        if len(text) < 1900:
+            await ctx.send(codeblock(text, lang="txt"))
+        else:
+            await ctx.send(file=codefile(text, filename="startup.txt"))
+
     async def cog_check(self, ctx):
         return ctx.author.id in self.bot.owner_ids
 
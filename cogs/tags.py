@@ -22,24 +22,47 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import gzip
+import logging
+import os
+import tempfile
+import zlib
+
+import aiohttp
 import discord
-import tortoise
-from discord.ext import commands
+from tortoise.exceptions import IntegrityError
+from discord.ext import commands, tasks
 
-from tools import Tag, Lowercase
+from tags import Tag, TagCache, TagImport, TagIndex, TagUsage, Lowercase, export_tags, read_ndjson, search_tags
+from tools import Timer
 
 
 def autocomplete_tag(owner=False, **kwargs):
     async def wrapper(ctx):
-        kwargs['guild'] = ctx.interaction.guild.id
+        guild_id = ctx.interaction.guild_id
+        if ctx.bot.rate_limiter.hit('tag autocomplete', ctx.interaction.user.id, guild_id):
+            return []
+        author_id = None
         if owner:
             if ctx.interaction.guild:
-                if not ctx.interaction.author.guild_permissions.manage_messages:
-                    kwargs['author'] = ctx.interaction.user.id
+                if not ctx.interaction.user.guild_permissions.manage_messages:
+                    author_id = ctx.interaction.user.id
             else:
-                kwargs['author'] = ctx.interaction.user.id
+                author_id = ctx.interaction.user.id
+
+        cog = ctx.bot.get_cog("Tags")
+        if cog is not None and cog.index.ready:
+            return cog.index.search(guild_id, ctx.value, author=author_id)
 
-        return [tag.name for tag in await Tag.filter(name__istartswith=ctx.value, **kwargs).limit(25)]
+        # The index is still warming up, fall back to querying the database
+        filters = dict(kwargs, guild=guild_id)
+        if author_id is not None:
+            filters['author'] = author_id
+        # names are stored lowercased, so a range over the (guild, name) index covers the prefix
+        prefix = ctx.value.lower()
+        tags = Tag.filter(name__gte=prefix, name__lt=prefix + '\U0010ffff', **filters).order_by('name').limit(25)
+        tags = tags.using_db(ctx.bot.storage.db.reader())
+        return await tags.values_list('name', flat=True)
 
     return wrapper
 
@@ -47,6 +70,15 @@ def autocomplete_tag(owner=False, **kwargs):
 class Tags(commands.Cog):
     def __init__(self, bot) -> None:
         self.bot = bot
+        self.index = TagIndex()
+        cache_config = bot.config.view('tag_cache', {})
+        self.cache = TagCache(size=cache_config.get('size', 1024), ttl=cache_config.get('ttl', 600), db=bot.storage.db)
+        self.usage = TagUsage()
+        self.flush_usage.change_interval(seconds=bot.config.view('tag_usage_flush', 30))
+        self.flush_usage.start()
+        bot.shutdown_hooks.append(self.usage.flush)
+        if bot.storage.db.ready:  # the cog was loaded after the database was set up
+            bot.loop.create_task(self.warm())
         # TODO: Rewrite this implementation once the library fully supports slash commands in cogs
 
         tags = bot.command_group("tags", "Tag editing commands")
@@ -58,20 +90,66 @@ class Tags(commands.Cog):
             """
             Create a tag
             """
-            if await Tag.exists(name=name):
+            if ctx.guild is None:
+                return await ctx.respond("Error: Tags can only be created in a server.")
+            guild_id = ctx.guild.id
+
+            if await Tag.exists(guild=guild_id, name=name):
                 return await ctx.respond("That tag already exists!")
             if len(discord.utils.escape_markdown(content)) > 2000:
                 return await ctx.respond("Content is too long!")
 
+            try:
+                tag = await Tag.create(
+                    name=name,
+                    content=content,
+                    author=ctx.author.id,
+                    guild=guild_id
+                )
+            except IntegrityError as e:
+                if 'UNIQUE' not in str(e):
+                    raise
+                return await ctx.respond("That tag already exists!")  # created by someone else in the meantime
+            self.index.add(guild_id, ctx.author.id, name)
+            self.cache.invalidate(guild_id, name)
+            self.usage.add(tag.id, guild_id, name)
+            await ctx.respond(f"Tag `{name}` created successfully.")
+
+        @tags.command()
+        async def top(ctx):
+            """
+            Show the most used tags
+            """
             guild_id = ctx.guild.id if ctx.guild else None
+            entries = self.usage.top(guild_id)
+            if not entries:
+                return await ctx.respond("There are no tags here yet!")
+            await ctx.respond('\n'.join(
+                f"{position}. `{name}`: {uses} use{'' if uses == 1 else 's'}"
+                for position, (name, uses) in enumerate(entries, start=1)
+            ))
 
-            await Tag.create(
-                name=name,
-                content=content,
-                author=ctx.author.id,
-                guild=guild_id
-            )
-            await ctx.respond(f"Tag `{name}` created successfully.")
+        @tags.command()
+        @discord.option("query", description="Words to look for in tag names and content")
+        @discord.option("page", description="Page of results", min_value=1)
+        async def search(ctx, query, page: int = 1):
+            """
+            Search tags by name and content
+            """
+            per_page = 10
+            guild_id = ctx.guild.id if ctx.guild else None
+            # one extra result tells whether there is a next page
+            results = await search_tags(self.bot.storage.db.reader(), guild_id, query,
+                                        limit=per_page + 1, offset=(page - 1) * per_page)
+            if not results:
+                return await ctx.respond("No tags found!")
+            lines = []
+            for position, (name, snippet) in enumerate(results[:per_page], start=(page - 1) * per_page + 1):
+                snippet = discord.utils.escape_markdown(' '.join(snippet.split()))
+                lines.append(f"{position}. `{name}`: {snippet.replace(chr(2), '**').replace(chr(3), '**')}")
+            if len(results) > per_page:
+                lines.append(f"Use page {page + 1} for more results.")
+            await ctx.respond('\n'.join(lines), allowed_mentions=discord.AllowedMentions.none())
 
         @tags.command()
         @discord.option("name", description="Name of the tag", autocomplete=autocomplete_tag())
@@ -87,12 +165,15 @@ class Tags(commands.Cog):
             """
             Delete a tag
             """
-            tag = await Tag.get(name=name)
+            tag = await Tag.get_or_none(guild=ctx.guild.id if ctx.guild else None, name=name)
             if not tag:
                 return await ctx.respond("That tag doesn't exist!")
             if tag.author != ctx.author.id and not ctx.author.guild_permissions.manage_messages:
                 return await ctx.respond("You don't have permission to delete that tag!")
             await tag.delete()
+            self.index.remove(tag.guild, tag.author, tag.name)
+            self.cache.invalidate(tag.guild, tag.name)
+            self.usage.remove(tag.id)
             await ctx.respond(f"Tag `{name}` deleted successfully.")
 
 
@@ -103,7 +184,7 @@ class Tags(commands.Cog):
             """
             Edit a tag
             """
-            tag = await Tag.get(name=name)
+            tag = await Tag.get_or_none(guild=ctx.guild.id if ctx.guild else None, name=name)
             if not tag:
                 return await ctx.respond("That tag doesn't exist!")
             if tag.author != ctx.author.id and not ctx.author.guild_permissions.manage_messages:
@@ -111,17 +192,111 @@ class Tags(commands.Cog):
             if len(discord.utils.escape_markdown(content)) > 2000:
                 return await ctx.respond("Content is too long!")
 
-            await Tag.filter(name=name).update(content=content)
+            await Tag.filter(id=tag.id).update(content=content)
+            self.cache.invalidate(tag.guild, tag.name)
             await ctx.respond(f"Tag `{name}` edited successfully.")
 
 
-    @staticmethod
-    async def tag_get(ctx, name):
+    def cog_unload(self):
+        self.flush_usage.cancel()
+        self.bot.shutdown_hooks.remove(self.usage.flush)
+        self.bot.loop.create_task(self.usage.flush())
+
+    async def warm(self):
+        self.index.start_warming()
+        self.usage.start_warming()
+        rows = await Tag.all().using_db(self.bot.storage.db.reader()).values_list('id', 'guild', 'author', 'name', 'uses')
+        self.index.load(rows)
+        self.usage.load(rows)
+
+    @tasks.loop(seconds=30)
+    async def flush_usage(self):
+        # the loop would stop for good on an error, and the uses that failed are retried on the next flush anyway
         try:
-            tag = await Tag.get(name=name)
-            await ctx.respond(tag.content)
-        except tortoise.exceptions.DoesNotExist:
-            await ctx.respond("That tag does not exist!")
+            await self.usage.flush()
+        except Exception as e:
+            logging.error("Couldn't flush tag usage: %s", e)
+
+    @flush_usage.before_loop
+    async def before_flush_usage(self):
+        await self.bot.wait_until_ready()
+
+    @commands.Cog.listener()
+    async def on_db_ready(self):
+        await self.warm()
+
+    async def tag_get(self, ctx, name):
+        guild_id = ctx.guild.id if ctx.guild else None
+        tag = await self.cache.get(guild_id, name)
+        if tag is None:
+            return await ctx.respond("That tag does not exist!")
+        self.usage.record(tag.id)
+        await ctx.respond(tag.content)
+
+    @commands.command(name='tagcache')
+    @commands.is_owner()
+    async def _tagcache(self, ctx, clear: bool = False):
+        """Show the tag cache statistics, optionally clearing it"""
+        stats = self.cache.stats()
+        if clear:
+            self.cache.clear()
+        await ctx.send('\n'.join(f'{key.title()}: {value}' for key, value in stats.items()))
+
+    @commands.command(name='tagexport')
+    @commands.is_owner()
+    async def _tagexport(self, ctx, guild_id: int = None):
+        """Export a guild's tags as gzipped NDJSON, one tag per line"""
+        if guild_id is None:
+            guild_id = ctx.guild.id if ctx.guild else None
+        timer = Timer()
+        fd, path = tempfile.mkstemp(suffix='.ndjson.gz')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as file:
+                count = await export_tags(self.bot.storage.db.reader(), guild_id, file)
+            timer.finish()
+            limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+            if os.path.getsize(path) > limit:
+                return await ctx.send(f"Error: The export of {count} tags is too large to upload.")
+            await ctx.send(f"Exported {count} tags in {timer.duration:.2f}s "
+                           f"({count / max(timer.duration, 1e-9):.0f} tags/s).",
+                           file=discord.File(path, filename=f"tags-{guild_id}.ndjson.gz"))
+        finally:
+            os.remove(path)
+
+    @commands.command(name='tagimport')
+    @commands.is_owner()
+    async def _tagimport(self, ctx, policy: str = 'skip', guild_id: int = None, url: str = None):
+        """
+        Import tags from an attached or linked NDJSON file, gzipped or not.
+        Existing names are skipped, overwritten or renamed depending on the policy.
+        """
+        if policy not in TagImport.policies:
+            return await ctx.send(f"Error: The policy must be one of {', '.join(TagImport.policies)}.")
+        if url is None:
+            if not ctx.message.attachments:
+                return await ctx.send("Error: Attach a file or give its URL.")
+            url = ctx.message.attachments[0].url
+        if guild_id is None:
+            guild_id = ctx.guild.id if ctx.guild else None
+        job = TagImport(guild_id, ctx.author.id, policy=policy, index=self.index, cache=self.cache, usage=self.usage)
+        timer = Timer()
+        async with ctx.typing():
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        await job.run(read_ndjson(response.content))
+            except (aiohttp.ClientError, zlib.error) as e:
+                return await ctx.send(f"Error: {e}\nImported before the error: "
+                                      + ', '.join(f'{key} {value}' for key, value in job.counts.items()))
+            if job.rebuild_index:
+                await self.warm()
+        timer.finish()
+        await ctx.send(
+            '\n'.join(f'{key.title()}: {job.counts[key]}' for key in
+                      ('read', 'created', 'overwritten', 'renamed', 'skipped', 'invalid'))
+            + f"\nFinished in {timer.duration:.2f}s ({job.counts['read'] / max(timer.duration, 1e-9):.0f} rows/s)"
+        )
 
     @discord.slash_command()
     @discord.option("name", description="Name of the tag", autocomplete=autocomplete_tag())
@@ -21,17 +21,30 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
-import inspect
-import os
+import sys
+
+from startup import ImportProfiler, Startup
+
+startup = Startup()
+if '--profile-startup' in sys.argv:
+    startup.profiler = ImportProfiler()
+    startup.profiler.install()
+
+import asyncio
+import logging
 import time
 
 import discord
-from discord import SlashCommand, Option, SlashCommandGroup, option, OptionChoice, AllowedMentions
-from discord.ext import commands
+from discord import Option, OptionChoice, AllowedMentions
+from discord.ext import commands, tasks
 
-from tools import Bot, send_code, get_prefix
+from bf import BrainfuckError
+from tools import Bot, send_code, get_prefix, atomic_write
 
-bot = Bot(command_prefix=get_prefix,
+startup.record('imports', time.perf_counter() - startup.started)
+
+bot = Bot(startup=startup,
+          command_prefix=get_prefix,
           case_insensitive=True,
           strip_after_prefix=True,
           intents=discord.Intents.all(),
@@ -43,36 +56,59 @@ github = bot.create_group("github", "Commands related to github.")
 
 repo = 'https://github.com/Pycord-Development/pycord'
 
-for cog in bot.config.get('cogs', []):
-    try:
-        bot.load_extension(cog)
-        print(cog)
-    except discord.DiscordException:
-        if __name__ == "__main__":
-            print(f'!!! {cog} !!!')
-        else:
-            raise
+with startup.phase('extension load'):
+    for cog in bot.config.get('cogs', []):
+        if cog in bot.lazy_extensions:
+            continue
+        try:
+            bot.load_extension(cog)
+            print(cog)
+        except discord.DiscordException:
+            # __mp_main__ is the brainfuck fork server importing the bot, see BrainfuckExecutor
+            if __name__ in ("__main__", "__mp_main__"):
+                print(f'!!! {cog} !!!')
+            else:
+                raise
+
+
+async def run_brainfuck(ctx, kind, argument, **options):
+    job = asyncio.ensure_future(bot.bf_executor.submit(kind, argument, **options))
+    done, _ = await asyncio.wait({job}, timeout=1.5)
+    if not done:  # don't let the interaction expire while the program runs
+        await ctx.defer()
+    return await job
 
 
 @brainfuck.command()
-async def encode(ctx, text: Option(str, "Text to encode in brainfuck")):
+async def encode(ctx, text: Option(str, "Text to encode in brainfuck"),
+                 effort: Option(int, "How hard to look for a shorter program", required=False,
+                                min_value=1, max_value=256) = None):
     """Encode text into brainfuck."""
-    encoded = bot.brainfuck.encode(text)
-    await send_code(ctx, encoded.code, lang="bf")
+    try:
+        encoded = await run_brainfuck(ctx, 'encode', text, effort=effort)
+    except BrainfuckError as e:
+        return await ctx.respond(f"Error: {e}")
+    await send_code(ctx, encoded, lang="bf")
 
 
 @brainfuck.command(name="compile")
 async def _compile(ctx, code: Option(str, "Brainfuck code to compile into python")):
     """Compile brainfuck into python."""
-    compiled = bot.brainfuck.compile(code)
-    await send_code(ctx, compiled.code, lang="py")
+    try:
+        compiled = await run_brainfuck(ctx, 'compile', code)
+    except BrainfuckError as e:
+        return await ctx.respond(f"Error: {e}")
+    await send_code(ctx, compiled, lang="py")
 
 
 @brainfuck.command()
 async def decode(ctx, code: Option(str, "Brainfuck code to decode into text")):
     """Decode brainfuck into text."""
-    decoded = bot.brainfuck.decode(code)
-    await send_code(ctx, decoded.text, lang="txt", filename="text.txt")
+    try:
+        decoded = await run_brainfuck(ctx, 'decode', code)
+    except BrainfuckError as e:
+        return await ctx.respond(f"Error: {e}")
+    await send_code(ctx, decoded, lang="txt", filename="text.txt")
 
 
 @bot.slash_command()
@@ -86,6 +122,22 @@ async def invite(ctx):
     await ctx.respond("I'm glad you want to add me to your server, here's a link!", view=view)
 
 
+@bot.slash_command()
+async def prefix(ctx,
+                 new: Option(str, "New prefixes for this server, separated by spaces", required=False),
+                 reset: Option(bool, "Go back to the default prefix", required=False, default=False)):
+    """View or change the command prefixes for this server."""
+    if ctx.guild is None:
+        return await ctx.respond("Error: Custom prefixes can only be set in servers")
+    if new is None and not reset:
+        prefixes = ', '.join(f'`{discord.utils.escape_markdown(p)}`' for p in bot.prefixes.get(ctx.guild.id))
+        return await ctx.respond(f"My prefixes here are {prefixes}")
+    if not ctx.author.guild_permissions.manage_guild:
+        return await ctx.respond("You need the Manage Server permission to change my prefix!")
+    bot.prefixes.set(ctx.guild.id, None if reset else new.split())
+    await ctx.respond("Prefix reset to the default" if reset else "Prefix updated")
+
+
 @bot.slash_command()
 async def ping(ctx):
     """Get the latency of the bot."""
@@ -105,9 +157,40 @@ async def ping(ctx):
 
     latencies["round trip"] = end - start
 
+    start = time.perf_counter()
+    await bot.http.get_gateway()
+    latencies["rest"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await bot.storage.db.reader().execute_query("SELECT 1")
+    latencies["database"] = time.perf_counter() - start
+
+    p50, p95, p99 = bot.lag_monitor.percentiles(50, 95, 99)
+    latencies.update({"loop lag p50": p50, "loop lag p95": p95, "loop lag p99": p99})
+
     await ctx.edit(content=comp_message())
 
 
+@bot.slash_command()
+@commands.is_owner()
+async def stats(ctx):
+    """See how long commands take to run."""
+    rows = bot.metrics.summary()
+    if not rows:
+        return await ctx.respond("No commands have been run yet")
+    lines = [f"{'command':<24}{'calls':>7}{'errors':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'db':>8}{'http':>8}"]
+    for name, calls, errors, p50, p95, p99, db, http in rows:
+        lines.append(f"{name[:23]:<24}{calls:>7}{errors:>7}{p50 * 1000:>6.0f}ms{p95 * 1000:>6.0f}ms{p99 * 1000:>6.0f}ms"
+                     f"{db * 1000:>6.0f}ms{http * 1000:>6.0f}ms")
+    await send_code(ctx, '\n'.join(lines), lang="txt", filename="stats.txt")
+
+
+@tasks.loop(seconds=60)
+async def write_metrics():
+    path = f"{bot.storage.storage_dir}/metrics.prom"
+    await bot.loop.run_in_executor(None, atomic_write, path, bot.metrics.prometheus())
+
+
 @github.command()
 async def issue(ctx, number: Option(int, "Issue number")):
     """View an issue from the pycord github repo."""
@@ -126,50 +209,84 @@ async def pr(ctx, number: Option(int, "Pull request number")):
     await ctx.respond(f"Here's a link", view=view)
 
 
+async def complete_source(ctx):
+    if bot.rate_limiter.hit('source autocomplete', ctx.interaction.user.id, ctx.interaction.guild_id):
+        return []
+    return bot.source_index.search(ctx.value)
+
+
 @bot.slash_command()
-async def source(ctx, command: Option(str, "The command to view the source code for", required=False)):
+async def source(ctx, command: Option(str, "The command to view the source code for", required=False,
+                                      autocomplete=complete_source)):
     """View the source for a particular command or the whole bot."""
-    source_url = 'https://github.com/Pycord-Development/robocord'
-    branch = 'main'
     view = discord.ui.View()
     if command is None:
-        url = source_url
+        url = bot.source_index.url
         label = "Source code for entire bot"
     else:
-        command_split = command.split()
-        index = 0
-        obj = discord.utils.get(bot.application_commands.values(), name=command_split[index])
-        while isinstance(obj, SlashCommandGroup):
-            if index + 1 > len(command_split):
-                return await ctx.respond("Error: Command is a group. You must choose a subcommand from it.")
-            obj = discord.utils.get(obj.subcommands, name=command_split[index])
-        if not isinstance(obj, SlashCommand):
+        url = bot.source_index.get(command)
+        if url is False:
+            return await ctx.respond("Error: Command is a group. You must choose a subcommand from it.")
+        if url is None:
             return await ctx.respond("Error: Command could not be found")
-        # noinspection PyUnresolvedReferences
-        src = obj.callback.__code__
-        filename = src.co_filename
-        lines, firstlineno = inspect.getsourcelines(src)
-        location = os.path.relpath(filename).replace('\\', '/')
-
-        url = f'{source_url}/blob/{branch}/{location}#L{firstlineno}-L{firstlineno + len(lines) - 1}'
         content = await discord.ext.commands.clean_content(escape_markdown=True).convert(ctx, command)
         label = f'Source code for command "{content}"'
     view.add_item(discord.ui.Button(label="View Code", url=url))
     await ctx.respond(label, view=view)
 
 
+def _ord(n):
+    return str(n) + (
+        "th"
+        if 4 <= n % 100 <= 20
+        else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    )
+
+
 @bot.user_command(name="Join Position")
 async def _joinpos(ctx, member):
-    all_members = list(ctx.guild.members)
-    all_members.sort(key=lambda m: m.joined_at)
+    await bot.member_tables.ensure(ctx.guild)
+    position = bot.join_order.position(ctx.guild, member)
+    await ctx.respond(f"{member.mention} was the {_ord(position + 1)} person to join {ctx.guild.name}", allowed_mentions=AllowedMentions(users=False))
+
+
+@bot.slash_command()
+async def joined(ctx, position: Option(int, "The join position to look up, 1 being the first member", min_value=1)):
+    """See who was the nth person to join this server."""
+    if ctx.guild is None:
+        return await ctx.respond("Error: This command can only be used in servers")
+    await bot.member_tables.ensure(ctx.guild)
+    member_id = bot.join_order.member_at(ctx.guild, position - 1)
+    if member_id is None:
+        return await ctx.respond(f"Error: {ctx.guild.name} doesn't have {position} members")
+    await ctx.respond(f"<@{member_id}> was the {_ord(position)} person to join {ctx.guild.name}", allowed_mentions=AllowedMentions(users=False))
+
+
+@bot.listen('on_ready')
+async def build_join_order():
+    for guild in bot.guilds:
+        await bot.member_tables.refresh(guild)
+
+
+@bot.event
+async def on_guild_join(guild):
+    await bot.member_tables.refresh(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    bot.member_tables.discard(guild.id)
+
+
+@bot.event
+async def on_member_join(member):
+    bot.member_tables.add(member)
+
+
+@bot.event
+async def on_member_remove(member):
+    bot.member_tables.remove(member)
 
-    def _ord(n):
-        return str(n) + (
-            "th"
-            if 4 <= n % 100 <= 20
-            else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
-        )
-    await ctx.respond(f"{member.mention} was the {_ord(all_members.index(member) + 1)} person to join {ctx.guild.name}", allowed_mentions=AllowedMentions(users=False))
 
 role_option = Option(
     int,
@@ -222,29 +339,27 @@ class Developer(commands.Cog):
     @commands.command(name='reload', aliases=['r'])
     @commands.is_owner()
     async def _reload(self, ctx, cog_):
-        self.bot.reload_extension(cog_)
-        await ctx.send(f'Reloaded cog "{cog_}"')
+        [(_, duration, error)] = self.bot.reloader.reload([cog_])
+        if error is not None:
+            raise error
+        await ctx.send(f'Reloaded cog "{cog_}" in {duration * 1000:.0f}ms')
 
     @commands.command(name='loadall', aliases=['la'])
     @commands.is_owner()
     async def _loadall(self, ctx):
         data = self.bot.config.setdefault('cogs', [])
-        cogs = {
-            'loaded': [],
-            'not': []
-        }
+        results = []
         for cog_ in data:
             if cog_ in bot.extensions:
                 continue
+            start = time.perf_counter()
             try:
                 self.bot.load_extension(cog_)
-                cogs['loaded'].append(cog_)
-            except discord.DiscordException:
-                cogs['not'].append(cog_)
+                results.append((cog_, time.perf_counter() - start, None))
+            except discord.DiscordException as e:
+                results.append((cog_, time.perf_counter() - start, e))
 
-        await ctx.send('\n'.join([
-            ('\U00002705' if cog_ in cogs['loaded'] else '\U0000274c')
-            + cog_ for cog_ in data]) or "No cogs to load")
+        await ctx.send(self.bot.reloader.format(results) or "No cogs to load")
 
     @commands.command(name='unloadall', aliases=['ua'])
     @commands.is_owner()
@@ -266,29 +381,21 @@ class Developer(commands.Cog):
 
     @commands.command(name='reloadall', aliases=['ra'])
     @commands.is_owner()
-    async def _reloadall(self, ctx):
-        cogs = {
-            'reloaded': [],
-            'not': []
-        }
-        processing = bot.extensions.copy()
-        for cog_ in processing:
-            try:
-                self.bot.reload_extension(cog_)
-                cogs['reloaded'].append(cog_)
-            except discord.DiscordException:
-                cogs['not'].append(cog_)
-        await ctx.send('\n'.join([
-            ('\U00002705' if cog_ in cogs['reloaded'] else '\U0000274c')
-            + cog_ for cog_ in processing]) or "No cogs to reload")
+    async def _reloadall(self, ctx, everything: bool = False):
+        """Reload the cogs whose source changed, or every cog"""
+        reloader = self.bot.reloader
+        changed, modules = reloader.scan()
+        results = reloader.reload(reloader.plan(bot.extensions if everything else changed))
+        message = reloader.format(results) or "No cogs changed"
+        if modules:
+            message += f"\nChanged, but needs a restart: {', '.join(modules)}"
+        await ctx.send(message)
 
 
 bot.add_cog(Developer(bot))
 
 
-@bot.event
-async def on_ready():
-    print("ready")
+async def announce_restart():
     restart_channel = bot.cache.get("restart_channel")
     if restart_channel:
         print("Restarted")
@@ -297,15 +404,47 @@ async def on_ready():
         await channel.send("I'm back online")
     else:
         print(f"Logged in as {bot.user}")
-    await bot.storage.setup_db()
+
+
+async def startup_done():
+    # runs once connected, whether the session was identified or resumed from the previous process
+    bot.startup.end('gateway ready')
+    bot.source_index.build()
+    bot.lag_monitor.start()
+    bot.watchdog.start(bot.loop)
+    asyncio.ensure_future(bot.bf_executor.start())
+    if bot.config.view('dev_mode', False):
+        bot.reloader.start_watching(bot.config.view('reload_interval', 1.0))
+    if not write_metrics.is_running():
+        write_metrics.change_interval(seconds=bot.config.view('metrics_interval', 60))
+        write_metrics.start()
+    if bot.startup.finish():
+        if bot.startup.profiler is not None:
+            bot.startup.profiler.uninstall()
+            report = bot.startup.report() + "\n\n" + bot.startup.profiler.report()
+            atomic_write(f"{bot.storage.storage_dir}/startup_profile.txt", report)
+            logging.info("Startup profile:\n%s", report)
+        await bot.load_lazy_extensions()
+
+
+@bot.event
+async def on_ready():
+    print("ready")
+    await announce_restart()
+    await startup_done()
+
+
+@bot.listen('on_resumed')
+async def resumed_previous_session():
+    if not await bot.restore_session_state():
+        return  # an ordinary reconnect
+    await announce_restart()
+    await startup_done()
 
 
 @bot.event
 async def on_message_edit(before, after):
-    if before.content != after.content:  # invoke the command again on edit
-        if not after.author.bot:
-            ctx = await bot.get_context(after)
-            await bot.invoke(ctx)
+    bot.edit_reinvoker.handle(before, after)  # invoke the command again on edit
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import array
+import asyncio
+import bisect
+
+import discord
+
+
+class JoinOrder:
+    """
+    Members of each guild ordered by join date, stored as parallel arrays of join timestamps and member ids.
+    Each guild is sorted once and then kept up to date as members join and leave,
+    so a join position is a binary search instead of a sort.
+    """
+    def __init__(self):
+        self._guilds = {}  # guild id -> (array of timestamps, array of member ids)
+
+    def __contains__(self, guild_id):
+        return guild_id in self._guilds
+
+    def build(self, guild, members=None):
+        entries = sorted(
+            (member.joined_at.timestamp(), member.id)
+            for member in (guild.members if members is None else members)
+            if member.joined_at is not None
+        )
+        self._guilds[guild.id] = (array.array('d', (entry[0] for entry in entries)),
+                                  array.array('Q', (entry[1] for entry in entries)))
+
+    def discard(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+    def dump(self):
+        return dict(self._guilds)
+
+    def restore(self, guilds):
+        self._guilds.update(guilds)
+
+    @staticmethod
+    def _locate(times, ids, timestamp, member_id):
+        index = bisect.bisect_left(times, timestamp)
+        while index < len(times) and times[index] == timestamp and ids[index] < member_id:
+            index += 1
+        return index
+
+    def add(self, guild_id, member_id, joined_at):
+        if guild_id not in self._guilds or joined_at is None:
+            return
+        times, ids = self._guilds[guild_id]
+        timestamp = joined_at.timestamp()
+        index = self._locate(times, ids, timestamp, member_id)
+        if index < len(ids) and ids[index] == member_id:
+            return
+        times.insert(index, timestamp)
+        ids.insert(index, member_id)
+
+    def remove(self, guild_id, member_id, joined_at=None):
+        if guild_id not in self._guilds:
+            return
+        times, ids = self._guilds[guild_id]
+        if joined_at is not None:
+            index = self._locate(times, ids, joined_at.timestamp(), member_id)
+        else:
+            try:
+                index = ids.index(member_id)
+            except ValueError:
+                return
+        if index < len(ids) and ids[index] == member_id:
+            del times[index]
+            del ids[index]
+
+    def position(self, guild, member):
+        """The zero-based join position of a member, building the guild's index first if needed."""
+        if guild.id not in self._guilds:
+            self.build(guild)
+        times, ids = self._guilds[guild.id]
+        return self._locate(times, ids, member.joined_at.timestamp(), member.id)
+
+    def member_at(self, guild, position):
+        """The id of the member at a zero-based join position, or None if there aren't that many members."""
+        if guild.id not in self._guilds:
+            self.build(guild)
+        ids = self._guilds[guild.id][1]
+        return ids[position] if 0 <= position < len(ids) else None
+
+
+class MemberTables:
+    """
+    The only member data the bot uses: join times and ids, kept sorted in the JoinOrder arrays.
+    In lean mode members aren't cached, so the tables are filled by chunking each guild without caching the result.
+    """
+    def __init__(self, join_order, lean=False):
+        self.join_order = join_order
+        self.lean = lean
+        self._loaded = set()  # ids of the guilds whose tables are loaded
+        self._loading = {}  # guild id -> task loading the guild
+
+    def __contains__(self, guild_id):
+        return guild_id in self._loaded
+
+    def load(self, guild, members):
+        self.join_order.build(guild, members)
+        self._loaded.add(guild.id)
+
+    async def _load(self, guild):
+        try:
+            members = await guild.chunk(cache=False) if self.lean else guild.members
+            self.load(guild, members)
+        finally:
+            self._loading.pop(guild.id, None)
+
+    async def refresh(self, guild):
+        """(Re)load the tables of a guild, sharing the request with anyone else loading it."""
+        task = self._loading.get(guild.id)
+        if task is None:
+            task = self._loading[guild.id] = asyncio.ensure_future(self._load(guild))
+        await asyncio.shield(task)
+
+    async def ensure(self, guild):
+        if guild.id not in self._loaded:
+            await self.refresh(guild)
+
+    def discard(self, guild_id):
+        self._loaded.discard(guild_id)
+        self.join_order.discard(guild_id)
+
+    def add(self, member):
+        self.join_order.add(member.guild.id, member.id, member.joined_at)
+
+    def remove(self, member):
+        self.remove_id(member.guild.id, member.id, member.joined_at)
+
+    def remove_id(self, guild_id, member_id, joined_at=None):
+        self.join_order.remove(guild_id, member_id, joined_at)
+
+    def snapshot(self):
+        """All tables as a picklable dict, for restore in the next process."""
+        return {'join_order': self.join_order.dump()}
+
+    def restore(self, snapshot):
+        self.join_order.restore(snapshot['join_order'])
+        self._loaded.update(snapshot['join_order'])
+
+
+def lean_options():
+    """Client options for lean mode: only the intents the bot's features use, and no member cache."""
+    intents = discord.Intents.default()
+    intents.members = True  # join and leave events keep the join order up to date, chunking needs it too
+    intents.message_content = True  # prefix commands
+    return dict(intents=intents, member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
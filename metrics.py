@@ -0,0 +1,331 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import copy
+import functools
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+
+class Histogram:
+    """Fixed-bucket histogram, cheap to update and good enough for percentiles."""
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        """Estimate a percentile (0-100) by interpolating inside the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if BUCKETS[index] != math.inf else lower * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-2]
+
+
+class CommandStats:
+    __slots__ = ('latency', 'errors', 'db_time', 'http_time')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.db_time = 0.0
+        self.http_time = 0.0
+
+
+class Sample:
+    """Time spent waiting on the database and on discord during a single invocation."""
+    __slots__ = ('db_time', 'http_time')
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.http_time = 0.0
+
+
+_current = contextvars.ContextVar('metrics_sample', default=None)
+
+
+class Metrics:
+    """
+    Latency histograms, error counts and time spent in the database and HTTP requests, per command.
+    The database and HTTP time is attributed to whichever command is running through a context variable.
+    """
+    def __init__(self):
+        self.commands = {}
+        self.db_time = 0.0
+        self.http_time = 0.0
+
+    def _stats(self, name):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    @contextlib.contextmanager
+    def measure(self, name, timer):
+        """Time a command invocation with a started tools.Timer."""
+        sample = Sample()
+        token = _current.set(sample)
+        try:
+            yield sample
+        finally:
+            _current.reset(token)
+            stats = self._stats(name)
+            stats.latency.observe(timer.finish())
+            stats.db_time += sample.db_time
+            stats.http_time += sample.http_time
+
+    def error(self, name):
+        self._stats(name).errors += 1
+
+    def _wrap(self, function, kind):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                setattr(self, kind, getattr(self, kind) + elapsed)
+                sample = _current.get()
+                if sample is not None:
+                    setattr(sample, kind, getattr(sample, kind) + elapsed)
+        wrapper.metrics_wrapped = True
+        return wrapper
+
+    def instrument_http(self, http):
+        if not getattr(http.request, 'metrics_wrapped', False):
+            http.request = self._wrap(http.request, 'http_time')
+
+    def instrument_db(self, connection):
+        for name in ('execute_query', 'execute_query_dict', 'execute_insert', 'execute_many', 'execute_script'):
+            method = getattr(connection, name, None)
+            if method is not None and not getattr(method, 'metrics_wrapped', False):
+                setattr(connection, name, self._wrap(method, 'db_time'))
+
+    def summary(self):
+        """Rows of (command, calls, errors, p50, p95, p99, average db time, average http time), slowest first."""
+        rows = []
+        for name, stats in self.commands.items():
+            calls = stats.latency.count
+            rows.append((
+                name, calls, stats.errors,
+                stats.latency.percentile(50), stats.latency.percentile(95), stats.latency.percentile(99),
+                stats.db_time / calls if calls else 0.0, stats.http_time / calls if calls else 0.0,
+            ))
+        rows.sort(key=lambda row: row[4], reverse=True)
+        return rows
+
+    def prometheus(self):
+        """Render everything in the prometheus text exposition format."""
+        lines = [
+            "# HELP robocord_command_duration_seconds Command latency.",
+            "# TYPE robocord_command_duration_seconds histogram",
+        ]
+        for name, stats in sorted(self.commands.items()):
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.latency.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'robocord_command_duration_seconds_bucket{{command="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'robocord_command_duration_seconds_sum{{command="{label}"}} {stats.latency.sum}')
+            lines.append(f'robocord_command_duration_seconds_count{{command="{label}"}} {stats.latency.count}')
+        for metric, kind, attribute in (
+            ("command_errors_total", "counter", "errors"),
+            ("command_db_seconds_total", "counter", "db_time"),
+            ("command_http_seconds_total", "counter", "http_time"),
+        ):
+            lines.append(f"# TYPE robocord_{metric} {kind}")
+            for name, stats in sorted(self.commands.items()):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'robocord_{metric}{{command="{label}"}} {getattr(stats, attribute)}')
+        lines += [
+            "# TYPE robocord_db_seconds_total counter",
+            f"robocord_db_seconds_total {self.db_time}",
+            "# TYPE robocord_http_seconds_total counter",
+            f"robocord_http_seconds_total {self.http_time}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class LagMonitor:
+    """
+    Measures event loop lag: how much later than scheduled a sleeping task wakes up.
+    Anything blocking the loop shows up here, samples are kept for a rolling window.
+    """
+    def __init__(self, interval=0.25, window=2400):
+        self.interval = interval
+        self.samples = collections.deque(maxlen=window)
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def percentiles(self, *qs):
+        if not self.samples:
+            return [0.0 for _ in qs]
+        ordered = sorted(self.samples)
+        return [ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)] for q in qs]
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stall:
+    __slots__ = ('count', 'total', 'longest', 'stack')
+
+    def __init__(self, stack):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.stack = stack
+
+
+class Watchdog:
+    """
+    A thread that notices when the event loop hasn't run a callback for longer than threshold seconds.
+    It then captures the stack of the loop's thread, logs it and aggregates stalls by the call site responsible,
+    which is the innermost frame from this project's code.
+    """
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        self.stalls = {}  # call site -> Stall, only touched while holding _lock
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread = None
+        self._beat = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, loop):
+        """Start watching, must be called from the thread running loop."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._beat = time.monotonic()
+        loop.call_soon(self._heartbeat)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _heartbeat(self):
+        self._beat = time.monotonic()
+        if not self._stopped.is_set():
+            self._loop.call_later(self.threshold / 4, self._heartbeat)
+
+    @staticmethod
+    def _call_site(stack):
+        for frame in reversed(stack):
+            if frame.filename.startswith(PROJECT_DIR) and frame.filename != __file__:
+                break
+        else:
+            frame = stack[-1]
+        return f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} in {frame.name}"
+
+    def _watch(self):
+        stalled = None  # (beat, call site, stack) of the stall in progress
+        while not self._stopped.wait(self.threshold / 4):
+            try:
+                stalled = self._check(stalled)
+            except Exception:
+                logging.exception("Event loop watchdog failed")
+                stalled = None
+
+    def _check(self, stalled):
+        beat = self._beat
+        if stalled is not None and beat != stalled[0]:
+            # the loop is running again, account for the whole stall
+            stalled_beat, site, stack = stalled
+            duration = beat - stalled_beat - self.threshold / 4
+            with self._lock:
+                # the report may have been cleared during the stall
+                stall = self.stalls.setdefault(site, Stall(stack))
+                stall.count += 1
+                stall.total += duration
+                stall.longest = max(stall.longest, duration)
+            stalled = None
+        if stalled is None and time.monotonic() - beat > self.threshold:
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                return None
+            summary = traceback.extract_stack(frame)
+            site = self._call_site(summary)
+            stack = ''.join(summary.format())
+            with self._lock:
+                self.stalls.setdefault(site, Stall(stack))
+            logging.warning("Event loop blocked for over %.2fs at %s\n%s", self.threshold, site, stack)
+            return beat, site, stack
+        return stalled
+
+    def report(self):
+        """Stalls as (call site, Stall) pairs, most total time first."""
+        with self._lock:
+            stalls = [(site, copy.copy(stall)) for site, stall in self.stalls.items()]
+        return sorted(stalls, key=lambda item: item[1].total, reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self.stalls.clear()
@@ -0,0 +1,85 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import discord
+
+
+def resume_once(client, session):
+    """
+    Make the client's next gateway connection resume a session instead of identifying.
+    Only this client's HTTP client and connection state are hooked, and only until the websocket is created:
+    the first asks for the session's gateway, the second turns the new websocket's identify into a resume.
+    If the session is no longer valid, the gateway invalidates it and the library identifies as usual.
+    """
+    http, state = client.http, client._connection
+    update_references = state._update_references
+
+    async def get_gateway(**kwargs):
+        del http.get_gateway
+        return session['url']
+
+    def resume(ws):
+        del state._update_references
+        update_references(ws)
+        ws.session_id = session['session_id']
+        ws.sequence = session['sequence']
+        ws.identify = ws.resume
+
+    http.get_gateway = get_gateway
+    state._update_references = resume
+
+
+def missing_internals(client):
+    """The private py-cord internals resuming relies on, see resume_once and Bot.restore_session_state."""
+    state = client._connection
+    needed = [
+        (client.http, 'get_gateway'), (client, '_ready'), (discord.gateway.DiscordWebSocket, 'resume'),
+        (state, '_update_references'), (state, '_add_guild'), (state, '_get_guild'), (state, 'parsers'),
+        (discord.Guild, '_add_channel'), (discord.Guild, '_add_thread'), (discord.Guild, '_add_member'),
+    ]
+    missing = [name for obj, name in needed if not hasattr(obj, name)]
+    if 'GUILD_MEMBER_ADD' not in getattr(state, 'parsers', {}):
+        missing.append("a GUILD_MEMBER_ADD parser")
+    return missing
+
+
+def track_missed_joins(client):
+    """
+    Discord replays the events missed during a restart right after the resume, before RESUMED, but the guilds
+    are only fetched once RESUMED arrives and the library drops member events for guilds it doesn't know.
+    Returns the set of guilds that had joins in that window, filled until the client is ready.
+    """
+    state = client._connection
+    parsers = state.parsers
+    parse = parsers['GUILD_MEMBER_ADD']
+    missed = set()
+
+    def parse_member_add(data):
+        if client.is_ready():
+            parsers['GUILD_MEMBER_ADD'] = parse  # every guild is known again
+        elif state._get_guild(int(data['guild_id'])) is None:
+            missed.add(int(data['guild_id']))
+        parse(data)
+
+    parsers['GUILD_MEMBER_ADD'] = parse_member_add
+    return missed
@@ -0,0 +1,132 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+# This module only uses the standard library, so that it can be imported before anything it has to measure
+import contextlib
+import importlib.abc
+import sys
+import time
+
+
+class Startup:
+    """Durations of each startup phase in the order they ran, measured from when main.py started executing."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.extensions = {}  # extension -> seconds it took to load
+        self.ready = None  # seconds from start until the bot was first ready
+        self.profiler = None
+        self._begun = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, duration):
+        self.phases[name] = duration
+
+    def begin(self, name):
+        """Start a phase that ends in another callback, see end."""
+        self._begun[name] = time.perf_counter()
+
+    def end(self, name):
+        start = self._begun.pop(name, None)
+        if start is not None:
+            self.record(name, time.perf_counter() - start)
+
+    def finish(self):
+        """Mark the bot as ready, returns whether this is the first time."""
+        if self.ready is not None:
+            return False
+        self.ready = time.perf_counter() - self.started
+        return True
+
+    def report(self):
+        lines = [f"{name:<32}{duration * 1000:>9.0f}ms" for name, duration in self.phases.items()]
+        if self.ready is not None:
+            lines.append(f"{'total until ready':<32}{self.ready * 1000:>9.0f}ms")
+        if self.extensions:
+            lines.append("\nextensions:")
+            lines += [f"  {name:<30}{duration * 1000:>9.0f}ms" for name, duration in self.extensions.items()]
+        return '\n'.join(lines)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    Times how long every module takes to import, both including and excluding the imports it triggers.
+    It wraps the loaders found by the other finders, so it has to be installed before the imports it should see.
+    """
+    def __init__(self):
+        self.inclusive = {}
+        self.exclusive = {}
+        self._stack = []  # time spent in child imports, one entry per import in progress
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # builtin and frozen importers are shared classes, only wrap per-module loader instances
+        if loader is None or isinstance(loader, type) or not hasattr(loader, 'exec_module'):
+            return spec
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+                self.inclusive[name] = elapsed
+                self.exclusive[name] = elapsed - children
+
+        loader.exec_module = timed_exec_module
+        return spec
+
+    def report(self, limit=40):
+        total = sum(self.exclusive.values())
+        lines = [f"{len(self.exclusive)} modules imported in {total * 1000:.0f}ms",
+                 f"{'self':>9}{'cumulative':>12}  module"]
+        for name in sorted(self.exclusive, key=self.exclusive.get, reverse=True)[:limit]:
+            lines.append(f"{self.exclusive[name] * 1000:>7.1f}ms{self.inclusive[name] * 1000:>10.1f}ms  {name}")
+        return '\n'.join(lines)
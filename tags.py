@@ -0,0 +1,553 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import bisect
+import collections
+import datetime
+import heapq
+import json
+import logging
+import operator
+import re
+import time
+import zlib
+
+import discord
+from tortoise.models import Model
+from tortoise import fields
+from tortoise.transactions import in_transaction
+
+
+class Tag(Model):
+    name = fields.CharField(null=False, max_length=100)
+    guild = fields.IntField(null=False)
+    author = fields.IntField(null=False)
+    content = fields.CharField(null=False, max_length=2000)
+    created = fields.DatetimeField(auto_now_add=True, null=False)
+    edited = fields.DatetimeField(auto_now=True, null=False)
+    uses = fields.IntField(null=False, default=0)
+
+    class Meta:
+        unique_together = (("guild", "name"),)
+        indexes = (("guild", "author", "name"),)
+
+    def raw_content(self):
+        return discord.utils.escape_markdown(self.content)
+
+
+async def _migrate_tag_guild_scope(connection):
+    # Names were only unique by convention and compared case-sensitively. The oldest tag of any duplicates keeps
+    # its lowercased name and the others are renamed name-2, name-3..., the way an import with the rename policy does.
+    taken = set()
+    duplicates = []
+    for row in await connection.execute_query_dict("SELECT id, guild, name FROM tag ORDER BY id"):
+        key = (row['guild'], row['name'].lower())
+        if key in taken:
+            duplicates.append(row)
+        else:
+            taken.add(key)
+    renames = []
+    for row in duplicates:
+        base, suffix = row['name'].lower(), 2
+        while (row['guild'], f"{base[:100 - len(str(suffix)) - 1]}-{suffix}") in taken:
+            suffix += 1
+        name = f"{base[:100 - len(str(suffix)) - 1]}-{suffix}"
+        taken.add((row['guild'], name))
+        renames.append([name, row['id']])
+        logging.warning("Renamed tag %r (id %s) in guild %s to %r, an older tag has the same name",
+                        row['name'], row['id'], row['guild'], name)
+    await connection.execute_script("UPDATE tag SET name = lower(name);")
+    if renames:
+        await connection.execute_many("UPDATE tag SET name = ? WHERE id = ?", renames)
+    await connection.execute_script("CREATE UNIQUE INDEX IF NOT EXISTS uid_tag_guild_name ON tag (guild, name);")
+    # the (guild, author, name) index comes from Tag.Meta.indexes, generate_schemas() adds it to existing tables
+
+
+async def _migrate_tag_search(connection):
+    # An external content FTS5 index over tag names and content, the guild is indexed too so searches can be scoped
+    # inside the index. The update trigger ignores the usage counter, which changes far more often than the text.
+    await connection.execute_script("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tag_fts USING fts5(
+            name, content, guild, content='tag', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS tag_fts_insert AFTER INSERT ON tag BEGIN
+            INSERT INTO tag_fts (rowid, name, content, guild) VALUES (new.id, new.name, new.content, new.guild);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tag_fts_delete AFTER DELETE ON tag BEGIN
+            INSERT INTO tag_fts (tag_fts, rowid, name, content, guild)
+            VALUES ('delete', old.id, old.name, old.content, old.guild);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tag_fts_update AFTER UPDATE OF name, content, guild ON tag BEGIN
+            INSERT INTO tag_fts (tag_fts, rowid, name, content, guild)
+            VALUES ('delete', old.id, old.name, old.content, old.guild);
+            INSERT INTO tag_fts (rowid, name, content, guild) VALUES (new.id, new.name, new.content, new.guild);
+        END;
+        INSERT INTO tag_fts (tag_fts, rank) VALUES ('rank', 'bm25(4.0, 1.0, 0.0)');
+        INSERT INTO tag_fts (tag_fts) VALUES ('rebuild');
+    """)
+
+
+# Tortoise only creates missing tables, so changes to existing ones are applied here, tracked with user_version
+MIGRATIONS = {
+    1: _migrate_tag_guild_scope,
+    2: _migrate_tag_search,
+}
+GENERATED_VERSION = 1  # the version of the schema generate_schemas() creates for a new database
+
+
+async def search_tags(connection, guild, text, limit=10, offset=0):
+    """
+    Full-text search of a guild's tags, best matches first.
+    Returns (name, snippet) pairs, with the matched words in the snippet wrapped in \\x02 and \\x03.
+    """
+    # every word is quoted, so nothing typed by the user is interpreted as query syntax; the last may be unfinished
+    words = re.findall(r"\w+", text)[:16]
+    if guild is None or not words:
+        return []
+    terms = ' AND '.join(f'{{name content}} : "{word}"' for word in words) + '*'
+    # ordering by the configured rank lets FTS5 sort internally, so snippets are only built for the returned page
+    rows = await connection.execute_query_dict(
+        "SELECT name, snippet(tag_fts, 1, char(2), char(3), '…', 12) AS snippet "
+        "FROM tag_fts WHERE tag_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+        [f'guild : "{int(guild)}" AND ({terms})', limit, offset])
+    return [(row['name'], row['snippet']) for row in rows]
+
+
+CachedTag = collections.namedtuple('CachedTag', 'id content')
+
+
+class TagCache:
+    """
+    Read-through LRU cache of tag lookups, keyed by (guild, name).
+    Tags that don't exist are cached too, so repeated misses don't reach the database.
+    """
+    def __init__(self, size=1024, ttl=600, db=None):
+        self.size = size
+        self.ttl = ttl
+        self.db = db  # lookups go through its readers when given
+        self._entries = collections.OrderedDict()  # (guild, name) -> (expires, CachedTag or None)
+        # a lookup only stores its result if the key wasn't invalidated while it was querying
+        self._lookups = collections.Counter()  # (guild, name) -> lookups in flight
+        self._invalidations = {}  # (guild, name) -> invalidations since, only while lookups are in flight
+        self._generation = 0  # bumped by clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, guild, name):
+        key = (guild, name)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            self.expirations += 1
+            del self._entries[key]
+        self.misses += 1
+        query = Tag.filter(guild=guild, name=name)
+        if self.db is not None:
+            query = query.using_db(self.db.reader())
+        generation, invalidations = self._generation, self._invalidations.get(key, 0)
+        self._lookups[key] += 1
+        try:
+            tag = await query.first()
+        finally:
+            stale = generation != self._generation or invalidations != self._invalidations.get(key, 0)
+            self._lookups[key] -= 1
+            if not self._lookups[key]:
+                del self._lookups[key]
+                self._invalidations.pop(key, None)
+        value = CachedTag(tag.id, tag.content) if tag else None
+        if stale:
+            return value  # it may predate the change that invalidated the key, don't keep it
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def invalidate(self, guild, name):
+        key = (guild, name)
+        self._entries.pop(key, None)
+        if key in self._lookups:
+            self._invalidations[key] = self._invalidations.get(key, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+        self._generation += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit rate': f"{(self.hits / lookups if lookups else 0):.1%}",
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class TagIndex:
+    """
+    Per-guild sorted arrays of tag names, used to answer autocomplete without querying the database.
+    Names are stored lowercased, the same way the tag commands store them.
+    """
+    def __init__(self):
+        self.ready = False
+        self._names = collections.defaultdict(list)  # guild -> sorted names
+        self._authored = collections.defaultdict(list)  # (guild, author) -> sorted names
+        self._pending = None  # changes made while warming, replayed once it finishes
+
+    def start_warming(self):
+        """Record changes from now on, so that they can be replayed on top of the rows passed to load()."""
+        self._pending = []
+
+    def load(self, rows):
+        """Rebuild the index from (id, guild, author, name, uses) rows."""
+        names = collections.defaultdict(list)
+        authored = collections.defaultdict(list)
+        for _, guild, author, name, _ in rows:
+            name = name.lower()
+            names[guild].append(name)
+            authored[guild, author].append(name)
+        for group in (names, authored):
+            for values in group.values():
+                values.sort()
+        self._names, self._authored = names, authored
+        pending, self._pending = self._pending or [], None
+        for op, args in pending:
+            op(*args)
+        self.ready = True
+
+    @staticmethod
+    def _insert(values, name):
+        index = bisect.bisect_left(values, name)
+        if index == len(values) or values[index] != name:
+            values.insert(index, name)
+
+    @staticmethod
+    def _remove(values, name):
+        index = bisect.bisect_left(values, name)
+        if index < len(values) and values[index] == name:
+            del values[index]
+
+    def add(self, guild, author, name):
+        name = name.lower()
+        if self._pending is not None:
+            self._pending.append((self.add, (guild, author, name)))
+        self._insert(self._names[guild], name)
+        self._insert(self._authored[guild, author], name)
+
+    def remove(self, guild, author, name):
+        name = name.lower()
+        if self._pending is not None:
+            self._pending.append((self.remove, (guild, author, name)))
+        self._remove(self._names.get(guild, []), name)
+        self._remove(self._authored.get((guild, author), []), name)
+
+    def search(self, guild, prefix, author=None, limit=25):
+        if author is None:
+            values = self._names.get(guild)
+        else:
+            values = self._authored.get((guild, author))
+        if not values:
+            return []
+        prefix = prefix.lower()
+        start = bisect.bisect_left(values, prefix)
+        results = []
+        for name in values[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            results.append(name)
+        return results
+
+
+async def read_ndjson(stream, chunk_size=65536):
+    """
+    Yield the objects of an NDJSON stream (an aiohttp StreamReader) as they arrive, gzipped or not.
+    Lines that aren't valid JSON objects are yielded as None.
+    """
+    decompressor = None
+    buffer = b''
+    started = False
+    async for data in stream.iter_chunked(chunk_size):
+        if not started:
+            started = True
+            if data[:2] == b'\x1f\x8b':
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        if decompressor is not None:
+            data = decompressor.decompress(data)
+        *lines, buffer = (buffer + data).split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line):
+    try:
+        value = json.loads(line)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+async def export_tags(connection, guild, file, page=1000):
+    """Write a guild's tags to a binary file as NDJSON, a page at a time in id order. Returns how many were written."""
+    last = 0
+    count = 0
+    while True:
+        rows = await Tag.filter(guild=guild, id__gt=last).order_by('id').limit(page).using_db(connection).values(
+            'id', 'name', 'content', 'author', 'created', 'uses')
+        if not rows:
+            return count
+        for row in rows:
+            last = row.pop('id')
+            row['created'] = row['created'].isoformat()
+            file.write(json.dumps(row).encode() + b'\n')
+        count += len(rows)
+
+
+class TagImport:
+    """
+    Imports tags into a guild in chunks, each in a single transaction.
+    Names already taken, in the guild or earlier in the chunk, are handled per policy with set-based queries:
+    skip keeps the existing tag, overwrite replaces its content and author, rename adds a -2, -3... suffix.
+    The tag index, cache and usage counters are kept up to date, except that past index_limit new tags
+    the index is left alone and rebuild_index is set, since a full rebuild is cheaper than that many inserts.
+    """
+    policies = ('skip', 'overwrite', 'rename')
+
+    def __init__(self, guild, author, policy='skip', chunk=500, index=None, cache=None, usage=None, index_limit=5000):
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {', '.join(self.policies)}")
+        self.guild = guild
+        self.author = author
+        self.policy = policy
+        self.chunk = chunk
+        self.index = index
+        self.cache = cache
+        self.usage = usage
+        self.index_limit = index_limit
+        self.rebuild_index = False
+        self.counts = collections.Counter()  # read, created, overwritten, renamed, skipped, invalid
+
+    async def run(self, rows):
+        """Import every row of an async iterable of dicts."""
+        batch = []
+        async for row in rows:
+            self.counts['read'] += 1
+            row = self._validate(row)
+            if row is None:
+                self.counts['invalid'] += 1
+                continue
+            batch.append(row)
+            if len(batch) >= self.chunk:
+                await self._import(batch)
+                batch = []
+        if batch:
+            await self._import(batch)
+
+    def _validate(self, row):
+        if row is None:
+            return None
+        name, content = row.get('name'), row.get('content')
+        if not isinstance(name, str) or not isinstance(content, str):
+            return None
+        name = name.strip().lower()
+        if not name or len(name) > 100 or not content or len(content) > 2000:
+            return None
+        author = row.get('author')
+        uses = row.get('uses')
+        try:
+            created = datetime.datetime.fromisoformat(row['created'])
+        except (KeyError, TypeError, ValueError):
+            created = None
+        return {
+            'name': name,
+            'content': content,
+            'author': author if isinstance(author, int) else self.author,
+            'created': created or datetime.datetime.now(datetime.timezone.utc),
+            'uses': uses if isinstance(uses, int) and uses >= 0 else 0,
+        }
+
+    async def _existing(self, connection, names, fields=('name',)):
+        """Rows of the given fields for the guild's tags with any of these names, queried in batches."""
+        names = list(names)
+        rows = []
+        for start in range(0, len(names), 500):  # stay under SQLite's limit on query parameters
+            rows += await Tag.filter(guild=self.guild, name__in=names[start:start + 500]).using_db(
+                connection).values_list(*fields)
+        return rows
+
+    async def _rename(self, connection, rows, taken):
+        """Give each row the first free name-N, checking ten candidates per row and query."""
+        suffix = 2
+        while rows:
+            candidates = {}
+            for row in rows:
+                candidates[id(row)] = [f"{row['name'][:100 - len(str(n)) - 1]}-{n}" for n in range(suffix, suffix + 10)]
+            taken.update(name for name, in await self._existing(
+                connection, {name for names in candidates.values() for name in names}))
+            remaining = []
+            for row in rows:
+                for name in candidates[id(row)]:
+                    if name not in taken:
+                        row['name'] = name
+                        taken.add(name)
+                        break
+                else:
+                    remaining.append(row)
+            rows = remaining
+            suffix += 10
+
+    async def _import(self, batch):
+        created, updated = [], {}
+        async with in_transaction("default") as connection:
+            existing = {name: (tag_id, author) for tag_id, name, author in await self._existing(
+                connection, {row['name'] for row in batch}, ('id', 'name', 'author'))}
+            chunk = {}  # name -> row, for duplicates inside the batch
+            conflicts = []
+            for row in batch:
+                name = row['name']
+                if name not in existing and name not in chunk:
+                    chunk[name] = row
+                elif self.policy == 'skip':
+                    self.counts['skipped'] += 1
+                elif self.policy == 'rename':
+                    conflicts.append(row)
+                elif name in chunk:
+                    chunk[name] = row  # the last one wins
+                else:
+                    updated[name] = (existing[name], row)  # the last one wins
+            if conflicts:
+                await self._rename(connection, conflicts, set(existing) | set(chunk))
+                for row in conflicts:
+                    chunk[row['name']] = row
+                self.counts['renamed'] += len(conflicts)
+            if chunk:
+                await Tag.bulk_create([Tag(guild=self.guild, **row) for row in chunk.values()], using_db=connection)
+                ids = dict(await self._existing(connection, chunk, ('name', 'id')))
+                created = [(ids[name], row) for name, row in chunk.items()]
+            if updated:
+                edited = datetime.datetime.now(datetime.timezone.utc).isoformat(" ")
+                await connection.execute_many(
+                    f"UPDATE {Tag._meta.db_table} SET content = ?, author = ?, edited = ? WHERE id = ?",
+                    [[row['content'], row['author'], edited, tag_id] for (tag_id, _), row in updated.values()])
+        self.counts['created'] += len(created)
+        self.counts['overwritten'] += len(updated)
+        self._apply(created, updated.values())
+
+    def _apply(self, created, updated):
+        if self.index is not None and not self.rebuild_index and self.counts['created'] > self.index_limit:
+            self.rebuild_index = True
+        for tag_id, row in created:
+            if self.index is not None and not self.rebuild_index:
+                self.index.add(self.guild, row['author'], row['name'])
+            if self.cache is not None:
+                self.cache.invalidate(self.guild, row['name'])
+            if self.usage is not None:
+                self.usage.add(tag_id, self.guild, row['name'])[2] = row['uses']
+        for (tag_id, author), row in updated:
+            if self.index is not None and not self.rebuild_index and author != row['author']:
+                self.index.remove(self.guild, author, row['name'])
+                self.index.add(self.guild, row['author'], row['name'])
+            if self.cache is not None:
+                self.cache.invalidate(self.guild, row['name'])
+
+
+class Lowercase:
+    def __init__(self):
+        pass
+
+    async def convert(self, text):
+        return text.lower()
+
+
+class TagUsage:
+    """
+    Tag use counters. Uses are accumulated in memory and written back in batches by flush(),
+    and the running totals are kept per guild so the leaderboard never has to sort the table.
+    """
+    def __init__(self):
+        self._pending = collections.Counter()  # tag id -> uses not written to the database yet
+        self._tags = {}  # tag id -> [guild, name, uses]
+        self._guilds = collections.defaultdict(dict)  # guild -> {tag id: [guild, name, uses]}
+        self._removed = None  # tags deleted while warming, so load() doesn't bring them back
+
+    def start_warming(self):
+        self._removed = set()
+
+    def load(self, rows):
+        """Load the totals from (id, guild, author, name, uses) rows, keeping uses that weren't flushed yet."""
+        removed, self._removed = self._removed or set(), None
+        for tag_id, guild, _, name, uses in rows:
+            if tag_id in removed:
+                continue
+            self.add(tag_id, guild, name)[2] = uses + self._pending[tag_id]
+
+    def add(self, tag_id, guild, name):
+        entry = self._tags.get(tag_id)
+        if entry is None:
+            entry = self._tags[tag_id] = self._guilds[guild][tag_id] = [guild, name, 0]
+        return entry
+
+    def remove(self, tag_id):
+        if self._removed is not None:
+            self._removed.add(tag_id)
+        self._pending.pop(tag_id, None)
+        entry = self._tags.pop(tag_id, None)
+        if entry is not None:
+            self._guilds[entry[0]].pop(tag_id, None)
+
+    def record(self, tag_id):
+        self._pending[tag_id] += 1
+        entry = self._tags.get(tag_id)
+        if entry is not None:
+            entry[2] += 1
+
+    def top(self, guild, limit=10):
+        """The most used tags in a guild, as (name, uses) pairs."""
+        entries = heapq.nlargest(limit, self._guilds.get(guild, {}).values(), key=operator.itemgetter(2))
+        return [(name, uses) for _, name, uses in entries]
+
+    async def flush(self):
+        """Add the pending uses to the database in a single transaction."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, collections.Counter()
+        try:
+            async with in_transaction("default") as connection:
+                await connection.execute_many(
+                    f"UPDATE {Tag._meta.db_table} SET uses = uses + ? WHERE id = ?",
+                    [[uses, tag_id] for tag_id, uses in pending.items()]
+                )
+        except Exception:
+            self._pending.update(pending)  # try again on the next flush
+            raise
@@ -0,0 +1,94 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import contextlib
+import io
+
+import pytest
+
+import bf
+
+HELLO = "++++++++[>++++[>++>+++>+++>+<<<<-]>+>+>->>+[<]<-]>>.>---.+++++++..+++.>>.<-.<.+++.------.--------.>>+."
+
+
+def run_python(code):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        exec(code, {})
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("code, expected", [
+    (HELLO, "Hello World!"),
+    ("+" * 65 + ".", "A"),
+    ("-" * 191 + ".", "A"),  # wraps around
+    ("++++++[>+++++++++++<-]>-.", "A"),  # multiply loop
+    ("+++++[-]" + "+" * 66 + ".", "B"),  # clear loop
+    ("+" * 67 + ">+>" + "+" * 66 + "<<[>]<.", "B"),  # scan loop
+    ("[.]" + "+" * 67 + ".", "C"),  # a loop that can't run
+    ("+" * 68 + "., .", "D\x00"),  # no input
+])
+def test_run(code, expected):
+    assert bf.run(code) == expected
+
+
+def test_optimize_folds_instructions():
+    program = bf.optimize("+++--->>><<[-]++[->+++<]>[>]")
+    assert program.ops == [bf.MOVE, bf.SET, bf.MUL, bf.MOVE, bf.SCAN]
+    assert program.args[:2] == [1, 2]
+
+
+@pytest.mark.parametrize("code, error", [
+    ("[", bf.BrainfuckError),
+    ("]", bf.BrainfuckError),
+    ("<", bf.BrainfuckError),
+    ("+[>+]", bf.BrainfuckError),  # off the end of the tape
+    ("+[]", bf.StepLimitExceeded),
+    ("+[.]", bf.OutputLimitExceeded),
+])
+def test_errors(code, error):
+    with pytest.raises(error):
+        bf.run(code, max_steps=100_000, max_output=1000)
+
+
+def test_step_limit_counts_optimized_steps():
+    assert bf.run("+" * 1000 + ".", max_steps=2) == chr(1000 % 256)
+    with pytest.raises(bf.StepLimitExceeded):
+        bf.run("+.>+.>+.", max_steps=5)
+
+
+@pytest.mark.parametrize("code", [
+    HELLO,
+    "++++++[>+++++++++++<-]>-.",
+    "+" * 67 + ">+>" + "+" * 66 + "<<[>]<.",
+    "+" * 70 + "[>+<-]>[<++>-]<.",
+    "-" * 3 + ".",
+])
+def test_to_python_matches_run(code):
+    assert run_python(bf.to_python(bf.optimize(code))) == bf.run(code)
+
+
+@pytest.mark.parametrize("text", ["", "Hello, World!", "pycord " * 20, "ünïcödé ✓"])
+def test_encode_round_trips(text):
+    code = bf.encode(text, effort=4, time_budget=0.1)
+    assert bf.run(code) == text
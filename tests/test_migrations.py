@@ -0,0 +1,111 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import sqlite3
+
+import pytest
+from tortoise.exceptions import IntegrityError
+
+from tags import MIGRATIONS, Tag, search_tags
+
+# the tag table as created before the migrations existed
+BASELINE_SCHEMA = """
+CREATE TABLE "tag" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" VARCHAR(100) NOT NULL,
+    "guild" INT NOT NULL,
+    "author" INT NOT NULL,
+    "content" VARCHAR(2000) NOT NULL,
+    "created" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "edited" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "uses" INT NOT NULL DEFAULT 0
+);
+"""
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """A database from before the migrations, with tags whose names only differ in case."""
+    connection = sqlite3.connect(tmp_path / "main.db")
+    connection.executescript(BASELINE_SCHEMA)
+    connection.executemany("INSERT INTO tag (name, guild, author, content) VALUES (?, ?, 10, ?)", [
+        ("Hello", 1, "first"),
+        ("hello", 1, "second"),
+        ("HELLO", 1, "third"),
+        ("hello-2", 1, "already taken"),
+        ("Hello", 2, "other guild"),
+    ])
+    connection.commit()
+    connection.close()
+
+
+async def schema(db):
+    version = (await db.writer.execute_query_dict("PRAGMA user_version"))[0]['user_version']
+    indexes = {row['name'] for row in await db.writer.execute_query_dict(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'tag' AND sql IS NOT NULL")}
+    tables = {row['name'] for row in await db.writer.execute_query_dict(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return version, indexes, tables
+
+
+def test_baseline_database_is_migrated(baseline, run_with_db):
+    async def test(db):
+        names = await Tag.all().order_by('id').values_list('guild', 'name', 'content')
+        assert names == [
+            (1, "hello", "first"),
+            (1, "hello-3", "second"),
+            (1, "hello-4", "third"),
+            (1, "hello-2", "already taken"),
+            (2, "hello", "other guild"),
+        ]
+        version, indexes, tables = await schema(db)
+        assert version == max(MIGRATIONS)
+        assert "uid_tag_guild_name" in indexes
+        assert "tag_fts" in tables
+        with pytest.raises(IntegrityError):
+            await Tag.create(name="hello", guild=1, author=10, content="duplicate")
+        assert [name for name, _ in await search_tags(db.writer, 1, "third")] == ["hello-4"]
+
+    run_with_db(test)
+
+
+def test_migrations_run_once(baseline, run_with_db):
+    async def test(db):
+        return await schema(db)
+
+    first = run_with_db(test)
+    assert run_with_db(test) == first
+
+
+def test_new_database_starts_at_the_latest_version(run_with_db):
+    async def test(db):
+        version, indexes, tables = await schema(db)
+        assert version == max(MIGRATIONS)
+        assert "uid_tag_guild_name" not in indexes  # generate_schemas() already made (guild, name) unique
+        assert "tag_fts" in tables
+        await Tag.create(name="hello", guild=1, author=10, content="searchable words")
+        with pytest.raises(IntegrityError):
+            await Tag.create(name="hello", guild=1, author=10, content="duplicate")
+        assert await search_tags(db.writer, 1, "search") != []
+
+    run_with_db(test)
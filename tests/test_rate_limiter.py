@@ -0,0 +1,112 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import types
+
+import pytest
+
+import tools
+from tools import Config, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.time, 'monotonic', clock)
+    return clock
+
+
+def make_limiter(ratelimits=None, size=10000):
+    parent = types.SimpleNamespace(update_config=lambda: None)
+    config = Config({'ratelimits': ratelimits or {}}, parent)
+    return RateLimiter(types.SimpleNamespace(config=config), size=size)
+
+
+def test_user_bucket_empties_and_refills(clock):
+    limiter = make_limiter({'cmd': {'user': [2, 10]}})
+    assert limiter.hit('cmd', 1) is None
+    assert limiter.hit('cmd', 1) is None
+    limit = limiter.hit('cmd', 1)
+    assert limit.scope == 'user' and limit.retry_after == pytest.approx(5)
+    assert limiter.hit('cmd', 2) is None  # other users have their own bucket
+    clock.now += 5
+    assert limiter.hit('cmd', 1) is None
+    assert limiter.hit('cmd', 1) is not None
+
+
+def test_guild_bucket_is_shared(clock):
+    limiter = make_limiter({'cmd': {'user': [5, 10], 'guild': [2, 10]}})
+    assert limiter.hit('cmd', 1, 100) is None
+    assert limiter.hit('cmd', 2, 100) is None
+    assert limiter.hit('cmd', 3, 100).scope == 'guild'
+    assert limiter.hit('cmd', 3, 200) is None
+    assert limiter.hit('cmd', 3) is None  # no guild bucket outside of guilds
+
+
+def test_limited_hits_take_no_tokens(clock):
+    limiter = make_limiter({'cmd': {'user': [1, 10], 'guild': [5, 10]}})
+    assert limiter.hit('cmd', 1, 100) is None
+    for _ in range(10):
+        assert limiter.hit('cmd', 1, 100) is not None
+    # only the first hit counted against the guild
+    for user in range(2, 6):
+        assert limiter.hit('cmd', user, 100) is None
+
+
+def test_unlimited_commands(clock):
+    limiter = make_limiter({'source': None})
+    for _ in range(100):
+        assert limiter.hit('source', 1) is None
+        assert limiter.hit('unknown', 1) is None
+    assert limiter.hit('bf encode', 1) is None  # the defaults still apply to other commands
+
+
+def test_config_changes(clock):
+    limiter = make_limiter({'cmd': {'user': [1, 10]}, 'other': {'user': [1, 10]}})
+    assert limiter.hit('cmd', 1) is None
+    assert limiter.hit('other', 1) is None
+    limiter.bot.config['unrelated'] = True
+    assert limiter.hit('cmd', 1) is not None  # buckets survive changes to other settings
+    limiter.bot.config['ratelimits'] = {'cmd': {'user': [1, 10]}, 'other': None}
+    assert limiter.hit('cmd', 1) is not None
+    assert limiter.hit('other', 1) is None
+    assert all(key[0] != 'other' for key in limiter._buckets)
+
+
+def test_evicts_buckets(clock):
+    limiter = make_limiter({'cmd': {'user': [1, 10]}}, size=3)
+    for user in range(5):
+        limiter.hit('cmd', user)
+    assert len(limiter._buckets) == 3
+    assert limiter.hit('cmd', 0) is None  # evicted, so full again
+    clock.now += 10
+    limiter.hit('cmd', 9)
+    assert list(limiter._buckets) == [('cmd', 'user', 9)]  # the others refilled and were dropped
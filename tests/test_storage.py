@@ -0,0 +1,78 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import asyncio
+import json
+
+import tools
+from tools import Storage
+
+
+def read(storage, filename):
+    with open(f"{storage.storage_dir}/{filename}.json") as f:
+        return json.load(f)
+
+
+def test_changes_are_written_once_debounced(tmp_path):
+    async def test():
+        storage = Storage(str(tmp_path))
+        storage.write_delay = 0.05
+        storage.config['a'] = 1
+        storage.config['b'] = 2
+        storage.cache['c'] = 3
+        assert not (tmp_path / "config.json").exists()
+        await asyncio.sleep(0.2)
+        assert read(storage, "config") == {'a': 1, 'b': 2}
+        assert read(storage, "cache") == {'c': 3}
+
+    asyncio.run(test())
+
+
+def test_failed_write_is_retried(tmp_path, monkeypatch):
+    async def test():
+        storage = Storage(str(tmp_path))
+        storage.write_delay = 0.05
+        write = tools.atomic_write
+        failures = []
+
+        def flaky_write(path, text):
+            if not failures:
+                failures.append(path)
+                raise OSError("disk full")
+            write(path, text)
+
+        monkeypatch.setattr(tools, 'atomic_write', flaky_write)
+        storage.config['a'] = 1
+        await asyncio.sleep(0.1)
+        assert failures and not (tmp_path / "config.json").exists()
+        await asyncio.sleep(0.2)
+        assert read(storage, "config") == {'a': 1}
+
+    asyncio.run(test())
+
+
+def test_flush_sync_outside_the_loop(tmp_path):
+    storage = Storage(str(tmp_path))
+    storage.config['a'] = 1  # no running loop, written straight away
+    assert read(storage, "config") == {'a': 1}
+    assert Storage(str(tmp_path)).config['a'] == 1
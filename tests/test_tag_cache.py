@@ -0,0 +1,115 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import asyncio
+
+from tags import Tag, TagCache
+
+
+async def create(name, content, guild=1):
+    return await Tag.create(name=name, content=content, guild=guild, author=2)
+
+
+def test_caches_hits_and_misses(run_with_db):
+    async def test(db):
+        cache = TagCache(db=db)
+        tag = await create("hello", "world")
+        assert (await cache.get(1, "hello")).content == "world"
+        assert await cache.get(1, "missing") is None
+        await Tag.filter(id=tag.id).update(content="changed")
+        await create("missing", "now it exists")
+        # both answers come from the cache until the keys are invalidated
+        assert (await cache.get(1, "hello")).content == "world"
+        assert await cache.get(1, "missing") is None
+        assert (cache.hits, cache.misses) == (2, 2)
+        cache.invalidate(1, "hello")
+        cache.invalidate(1, "missing")
+        assert (await cache.get(1, "hello")).content == "changed"
+        assert (await cache.get(1, "missing")).content == "now it exists"
+
+    run_with_db(test)
+
+
+def test_keys_are_scoped_to_guilds(run_with_db):
+    async def test(db):
+        cache = TagCache(db=db)
+        await create("hello", "first", guild=1)
+        assert await cache.get(2, "hello") is None
+        assert (await cache.get(1, "hello")).content == "first"
+
+    run_with_db(test)
+
+
+def test_evicts_least_recently_used(run_with_db):
+    async def test(db):
+        cache = TagCache(size=2, db=db)
+        for name in ("a", "b", "c"):
+            await create(name, name)
+        await cache.get(1, "a")
+        await cache.get(1, "b")
+        await cache.get(1, "a")
+        await cache.get(1, "c")  # evicts b, the least recently used
+        assert cache.evictions == 1
+        assert set(cache._entries) == {(1, "a"), (1, "c")}
+
+    run_with_db(test)
+
+
+def test_expires_entries(run_with_db):
+    async def test(db):
+        cache = TagCache(ttl=0, db=db)
+        await create("hello", "world")
+        await cache.get(1, "hello")
+        await cache.get(1, "hello")
+        assert (cache.hits, cache.misses, cache.expirations) == (0, 2, 1)
+
+    run_with_db(test)
+
+
+def test_lookup_invalidated_while_querying_is_not_stored(run_with_db):
+    async def test(db):
+        cache = TagCache(db=db)
+        tag = await create("hello", "old")
+        lookup = asyncio.ensure_future(cache.get(1, "hello"))
+        await asyncio.sleep(0)  # the lookup is now waiting for its query
+        await Tag.filter(id=tag.id).update(content="new")
+        cache.invalidate(1, "hello")
+        await lookup
+        assert (1, "hello") not in cache._entries
+        assert (await cache.get(1, "hello")).content == "new"
+        assert not cache._lookups and not cache._invalidations
+
+    run_with_db(test)
+
+
+def test_lookup_running_during_clear_is_not_stored(run_with_db):
+    async def test(db):
+        cache = TagCache(db=db)
+        await create("hello", "world")
+        lookup = asyncio.ensure_future(cache.get(1, "hello"))
+        await asyncio.sleep(0)
+        cache.clear()
+        assert (await lookup).content == "world"
+        assert not cache._entries
+
+    run_with_db(test)
@@ -0,0 +1,73 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+from tags import TagIndex
+
+
+def rows(*entries):
+    """(guild, author, name) entries as the (id, guild, author, name, uses) rows TagIndex.load takes."""
+    return [(tag_id, guild, author, name, 0) for tag_id, (guild, author, name) in enumerate(entries)]
+
+
+def test_search_by_prefix():
+    index = TagIndex()
+    index.load(rows((1, 10, "Hello"), (1, 10, "help"), (1, 11, "world"), (2, 10, "hello there")))
+    assert index.ready
+    assert index.search(1, "HE") == ["hello", "help"]
+    assert index.search(1, "") == ["hello", "help", "world"]
+    assert index.search(1, "x") == []
+    assert index.search(2, "hel") == ["hello there"]
+    assert index.search(3, "hel") == []
+
+
+def test_search_by_author_and_limit():
+    index = TagIndex()
+    index.load(rows((1, 10, "a1"), (1, 10, "a2"), (1, 10, "a3"), (1, 11, "a4")))
+    assert index.search(1, "a", author=11) == ["a4"]
+    assert index.search(1, "a", author=10, limit=2) == ["a1", "a2"]
+    assert index.search(1, "a", author=12) == []
+
+
+def test_add_and_remove():
+    index = TagIndex()
+    index.load([])
+    index.add(1, 10, "b")
+    index.add(1, 10, "a")
+    index.add(1, 10, "a")
+    assert index.search(1, "") == ["a", "b"]
+    index.remove(1, 10, "A")
+    index.remove(1, 10, "missing")
+    index.remove(2, 10, "b")
+    assert index.search(1, "") == ["b"]
+    assert index.search(1, "", author=10) == ["b"]
+
+
+def test_changes_while_warming_are_replayed():
+    index = TagIndex()
+    index.start_warming()
+    # the rows were read before these changes were made
+    index.add(1, 10, "new")
+    index.remove(1, 10, "deleted")
+    index.load(rows((1, 10, "deleted"), (1, 10, "kept")))
+    assert index.search(1, "") == ["kept", "new"]
+    assert index.search(1, "", author=10) == ["kept", "new"]
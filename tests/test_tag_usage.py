@@ -0,0 +1,80 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021-present Pycord Development
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import pytest
+
+from tags import Tag, TagUsage
+
+
+def test_totals_and_top():
+    usage = TagUsage()
+    usage.load([(1, 100, 10, "a", 5), (2, 100, 10, "b", 1), (3, 200, 10, "c", 9)])
+    for _ in range(6):
+        usage.record(2)
+    usage.record(1)
+    assert usage.top(100) == [("b", 7), ("a", 6)]
+    assert usage.top(100, limit=1) == [("b", 7)]
+    assert usage.top(200) == [("c", 9)]
+    usage.remove(3)
+    assert usage.top(200) == []
+
+
+def test_load_keeps_unflushed_uses():
+    usage = TagUsage()
+    usage.start_warming()
+    usage.record(1)
+    usage.record(1)
+    usage.remove(2)
+    usage.load([(1, 100, 10, "a", 5), (2, 100, 10, "b", 1)])
+    assert usage.top(100) == [("a", 7)]
+
+
+def test_flush_writes_pending_uses(run_with_db):
+    async def test(db):
+        tag = await Tag.create(name="a", content="a", guild=100, author=10, uses=5)
+        usage = TagUsage()
+        usage.add(tag.id, 100, "a")[2] = 5
+        usage.record(tag.id)
+        usage.record(tag.id)
+        await usage.flush()
+        assert (await Tag.get(id=tag.id)).uses == 7
+        await usage.flush()  # nothing pending
+        assert (await Tag.get(id=tag.id)).uses == 7
+
+    run_with_db(test)
+
+
+def test_failed_flush_keeps_pending_uses(run_with_db):
+    async def test(db):
+        tag = await Tag.create(name="a", content="a", guild=100, author=10)
+        usage = TagUsage()
+        usage.record(tag.id)
+        await db.writer.execute_script("ALTER TABLE tag RENAME TO tag_moved")
+        with pytest.raises(Exception):
+            await usage.flush()
+        usage.record(tag.id)  # used while the write was failing
+        await db.writer.execute_script("ALTER TABLE tag_moved RENAME TO tag")
+        await usage.flush()
+        assert (await Tag.get(id=tag.id)).uses == 2
+
+    run_with_db(test)
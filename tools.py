@@ -21,50 +21,213 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
+import asyncio
+import ast
+import bisect
 import collections
 import copy
+import gzip
+import hashlib
+import importlib.util
+import inspect
 import io
 import json
+import logging
 import os
+import pickle
+import sys
+import tempfile
+import threading
 import time
+import types
 from abc import ABC
 from functools import cached_property
-from typing import Union
 
-import bftools
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
-from tortoise.models import Model
-from tortoise import fields, Tortoise
+from tortoise import Tortoise
+
+from bf import BrainfuckExecutor
+from members import JoinOrder, MemberTables, lean_options
+from metrics import LagMonitor, Metrics, Watchdog
+from resume import missing_internals, resume_once, track_missed_joins
+from startup import Startup
+from tags import GENERATED_VERSION, MIGRATIONS, Tag
+
+
+def atomic_write(path, text):
+    """Replace a file's contents, so that readers (and crashes) never see a partially written file."""
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(dir=directory or ".", prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(text, bytes) else "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def freeze(value):
+    """Return a read-only version of a JSON value, with dicts as mapping proxies and lists as tuples."""
+    if isinstance(value, dict):
+        return types.MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
 
 
 class Config(collections.UserDict):
     def __init__(self, __dict, parent, **kwargs):
         self.parent = parent
+        self.version = 0  # bumped on every change, lets other caches know when to invalidate
+        self._views = {}
         super().__init__(__dict, **kwargs)
 
     def __getitem__(self, key):
         return copy.deepcopy(super().__getitem__(key))
 
     def __setitem__(self, key, item):
-        self._on_change()
         super().__setitem__(key, item)
+        self._on_change()
 
     def __delitem__(self, key):
-        self._on_change()
         super().__delitem__(key)
+        self._on_change()
+
+    def view(self, key, default=None):
+        """
+        Get a read-only snapshot of a value without copying it.
+        Snapshots are shared between callers and only rebuilt after the config changes.
+        """
+        try:
+            return self._views[key]
+        except KeyError:
+            pass
+        try:
+            value = self._views[key] = freeze(self.data[key])
+        except KeyError:
+            return default
+        return value
+
+    def _changed(self):
+        self.version += 1
+        self._views.clear()
 
     def _on_change(self):
+        self._changed()
         self.parent.update_config()
 
 
 class Cache(Config):
     def _on_change(self):
+        self._changed()
         self.parent.update_cache()
 
 
-class Context(discord.ApplicationContext):
+RateLimit = collections.namedtuple('RateLimit', 'retry_after scope rate per')
+
+
+class RateLimiter:
+    """
+    Token buckets per user and per guild for the commands that are expensive to run.
+    Limits come from the "ratelimits" config, keyed by command name, e.g. {"source": {"user": [5, 10]}}
+    allows five uses per user every ten seconds; null removes a command's limit.
+    Only buckets that aren't full are worth keeping, so the least recently used ones are evicted once they have
+    been idle long enough to refill, or when there are more than size of them.
+    """
+    defaults = {
+        'bf encode': {'user': [2, 10], 'guild': [6, 10]},
+        'bf compile': {'user': [3, 10], 'guild': [10, 10]},
+        'bf decode': {'user': [3, 10], 'guild': [10, 10]},
+        'source': {'user': [5, 10]},
+        'source autocomplete': {'user': [20, 10]},
+        'tag autocomplete': {'user': [20, 10], 'guild': [100, 10]},
+        'Join Position': {'user': [5, 10], 'guild': [20, 10]},
+        'joined': {'user': [5, 10], 'guild': [20, 10]},
+    }
+
+    def __init__(self, bot, size=10000):
+        self.bot = bot
+        self.size = size
+        self._buckets = collections.OrderedDict()  # (command, scope, id) -> [tokens, last update, refill time]
+        self._rules = None
+        self._config = None  # the "ratelimits" config the rules were built from
+        self._version = None
+
+    def rules(self):
+        """Command name -> {scope: (rate, per)}, rebuilt when the "ratelimits" config changes."""
+        if self._version != self.bot.config.version:
+            self._version = self.bot.config.version
+            config = self.bot.config.view('ratelimits', {})
+            if self._rules is None or config != self._config:
+                self._build(config)
+        return self._rules
+
+    def _build(self, config):
+        rules = {**self.defaults, **config}
+        self._rules = {command: {scope: (rate, per) for scope, (rate, per) in limits.items()}
+                       for command, limits in rules.items() if limits}
+        self._config = config
+        # buckets of limits that still exist are kept, hit() applies the new rate to them
+        for key in [key for key in self._buckets if key[1] not in self._rules.get(key[0], {})]:
+            del self._buckets[key]
+
+    def hit(self, command, user_id, guild_id=None):
+        """
+        Take a token from each of the command's buckets.
+        Returns None, or if any of them is empty the RateLimit of the one that takes longest to refill.
+        """
+        limits = self.rules().get(command)
+        if not limits:
+            return None
+        now = time.monotonic()
+        buckets = []
+        limited = None
+        for scope, (rate, per) in limits.items():
+            target = user_id if scope == 'user' else guild_id
+            if target is None:
+                continue
+            key = (command, scope, target)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(rate), now, per]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[:] = min(rate, bucket[0] + (now - bucket[1]) * rate / per), now, per
+            if bucket[0] < 1:
+                retry_after = (1 - bucket[0]) * per / rate
+                if limited is None or retry_after > limited.retry_after:
+                    limited = RateLimit(retry_after, scope, rate, per)
+            buckets.append(bucket)
+        if limited is None:
+            for bucket in buckets:
+                bucket[0] -= 1
+        self._evict(now)
+        return limited
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            _, (_, updated, per) = next(iter(buckets.items()))
+            if now - updated < per and len(buckets) <= self.size:
+                break
+            buckets.popitem(last=False)
+
+
+class RateLimited:
+    """Shared by both context classes, so application and prefix commands count against the same buckets."""
+    def rate_limit(self, command=None):
+        """Count a use of the command, returns None or the RateLimit saying how long to wait."""
+        if command is None:
+            command = self.command.qualified_name
+        return self.bot.rate_limiter.hit(command, self.author.id, self.guild.id if self.guild else None)
+
+
+class Context(RateLimited, discord.ApplicationContext):
     async def respond(self, *args, **kwargs):
         default = {
             'allowed_mentions': discord.AllowedMentions.none()
@@ -80,61 +243,279 @@ class Context(discord.ApplicationContext):
         await super().send(*args, **kwargs)
 
 
+class PrefixContext(RateLimited, commands.Context):
+    """
+    Context for prefix commands. When the invoking message was edited and the command runs again,
+    the first message sent edits the previous response instead of sending a new one.
+    """
+    editable = {'embed', 'embeds', 'view', 'allowed_mentions', 'delete_after'}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._responded = False
+
+    async def send(self, content=None, **kwargs):
+        responses = self.bot.responses
+        if not self._responded:
+            self._responded = True
+            previous = responses.get(self.message.id)
+            if previous is not None and set(kwargs) <= self.editable:
+                if 'embeds' not in kwargs:
+                    kwargs.setdefault('embed', None)
+                kwargs.setdefault('view', None)
+                try:
+                    await previous.edit(content=content, **kwargs)
+                    return previous
+                except discord.NotFound:
+                    pass
+            message = await super().send(content, **kwargs)
+            responses.set(self.message.id, message)
+            return message
+        return await super().send(content, **kwargs)
+
+
+class ResponseCache:
+    """Bounded map of command message ids to the bot's response, entries expire after max_age seconds."""
+    def __init__(self, size=1000, max_age=900):
+        self.size = size
+        self.max_age = max_age
+        self._entries = collections.OrderedDict()  # message id -> (time added, response)
+
+    def _expire(self):
+        deadline = time.monotonic() - self.max_age
+        while self._entries:
+            added, _ = next(iter(self._entries.values()))
+            if added > deadline and len(self._entries) <= self.size:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, message_id):
+        self._expire()
+        entry = self._entries.get(message_id)
+        return entry[1] if entry else None
+
+    def set(self, message_id, response):
+        self._entries.pop(message_id, None)
+        self._entries[message_id] = (time.monotonic(), response)
+        self._expire()
+
+
+class EditReinvoker:
+    """
+    Runs commands again when their message is edited.
+    Edits without a prefix are ignored before any context is built,
+    and a burst of edits to the same message only runs the command once, after the last one.
+    """
+    def __init__(self, bot, delay=1.0):
+        self.bot = bot
+        self.delay = delay
+        self._pending = {}  # message id -> timer handle
+
+    def handle(self, before, after):
+        if before.content == after.content or after.author.bot:
+            return
+        if not after.content.startswith(self.bot.prefixes.resolve(after.guild.id if after.guild else None)):
+            return
+        handle = self._pending.pop(after.id, None)
+        if handle is not None:
+            handle.cancel()
+        self._pending[after.id] = asyncio.get_running_loop().call_later(self.delay, self._fire, after)
+
+    def _fire(self, message):
+        self._pending.pop(message.id, None)
+        asyncio.ensure_future(self._invoke(message))
+
+    async def _invoke(self, message):
+        ctx = await self.bot.get_context(message)
+        await self.bot.invoke(ctx)
+
+
+class Database:
+    """
+    The SQLite database behind the models, set up once per process.
+    It runs in WAL mode so that reads don't wait for writes. The default Tortoise connection is the only writer,
+    read-only queries can be spread over separate reader connections with using_db(db.reader()).
+    """
+    pragmas = {
+        'synchronous': 'NORMAL',  # in WAL mode this only risks the last transactions on power loss, not corruption
+        'cache_size': -16000,  # in KiB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    }
+
+    def __init__(self, path, readers=2, pragmas=None):
+        self.path = path
+        self.reader_names = [f"reader_{n}" for n in range(readers)]
+        self.pragmas = {**self.pragmas, **(pragmas or {})}
+        self.ready = False
+        self._next_reader = 0
+
+    @property
+    def writer(self):
+        return Tortoise.get_connection('default')
+
+    def reader(self):
+        """A connection for read-only queries, round-robin over the readers."""
+        if not self.reader_names:
+            return self.writer
+        name = self.reader_names[self._next_reader % len(self.reader_names)]
+        self._next_reader += 1
+        return Tortoise.get_connection(name)
+
+    def connections(self):
+        return [self.writer] + [Tortoise.get_connection(name) for name in self.reader_names]
+
+    async def init(self):
+        if self.ready:
+            return
+        url = f'sqlite://{self.path}'
+        await Tortoise.init(config={
+            'connections': {'default': url, **{name: url for name in self.reader_names}},
+            'apps': {'models': {'models': ['tags'], 'default_connection': 'default'}},
+        })
+        writer = self.writer
+        # the journal mode is stored in the database file, the rest only lasts as long as the connection
+        await writer.execute_script("PRAGMA journal_mode = WAL")
+        pragmas = ''.join(f"PRAGMA {name} = {value};" for name, value in self.pragmas.items())
+        await writer.execute_script(pragmas)
+        for name in self.reader_names:
+            await Tortoise.get_connection(name).execute_script(pragmas + "PRAGMA query_only = ON;")
+        tables = await writer.execute_query_dict(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", [Tag._meta.db_table])
+        await Tortoise.generate_schemas()
+        await self.migrate(fresh=not tables)
+        self.ready = True
+
+    async def migrate(self, fresh=False):
+        rows = await self.writer.execute_query_dict("PRAGMA user_version")
+        version = rows[0]['user_version']
+        if fresh:
+            version = max(version, GENERATED_VERSION)
+        for target in sorted(MIGRATIONS):
+            if target > version:
+                await MIGRATIONS[target](self.writer)
+                version = target
+        await self.writer.execute_script(f"PRAGMA user_version = {version}")
+
+    async def close(self):
+        if not self.ready:
+            return
+        self.ready = False
+        try:
+            await self.writer.execute_script("PRAGMA optimize")
+        except Exception as e:
+            logging.error(e)
+        await Tortoise.close_connections()
+
+
 class Storage:
+    write_delay = 1.0  # seconds to wait for more changes before writing them out
+
     def __init__(self, storage_dir="storage"):
         self._initialized = False
         self.storage_dir = storage_dir
         self.config = None
         self.cache = None
-        if not os.path.exists(self.storage_dir):
-            os.mkdir(self.storage_dir)
-        for filename in ("config", "cache"):
-            if not os.path.exists(f"{self.storage_dir}/{filename}.json"):
-                open(f"{self.storage_dir}/{filename}.json", "x")
-                open(f"{self.storage_dir}/{filename}.json", "w").write("{}")
+        self._dirty = set()
+        self._generation = 0
+        self._written = {}  # filename -> generation of the data last written to it
+        self._write_lock = threading.Lock()
+        self._flush_handle = None
+        os.makedirs(self.storage_dir, exist_ok=True)
         self.load_config()
         self.load_cache()
+        self.db = Database(f"{self.storage_dir}/main.db", **self.config.view('database', {}))
         self._initialized = True
 
-    async def setup_db(self):
-        await Tortoise.init(
-            db_url=f'sqlite://{self.storage_dir}/main.db',
-            modules={'models': ['tools']})
-        await Tortoise.generate_schemas()
+    def _read(self, filename):
+        # missing files are created by the first write, no need to touch the disk for them here
+        try:
+            with open(f"{self.storage_dir}/{filename}.json", "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
 
     def load_config(self):
-        with open(f"{self.storage_dir}/config.json", "r") as f:
-            data = json.load(f)
-            self.config = Config(data, self)
-            return self.config
+        self.config = Config(self._read("config"), self)
+        return self.config
 
     def load_cache(self):
-        with open(f"{self.storage_dir}/cache.json", "r") as f:
-            data = json.load(f)
-            self.cache = Cache(data, self)
-            return self.cache
+        self.cache = Cache(self._read("cache"), self)
+        return self.cache
 
     def update_config(self):
-        try:
-            data = self.config.data
-            with open(f"{self.storage_dir}/config.json", "w") as f:
-                json.dump(data, f, indent=4)
-        except AttributeError:
-            if self._initialized:
-                raise
+        self._mark_dirty("config")
 
     def update_cache(self):
+        self._mark_dirty("cache")
+
+    def _mark_dirty(self, filename):
+        if not self._initialized:
+            return
+        self._dirty.add(filename)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # nothing to hand the write off to, e.g. before the bot is started
+            return self.flush_sync()
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.write_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    def _collect(self):
+        """Serialize every dirty file. This has to happen on the loop, while nothing can mutate the data."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._generation += 1
+        payloads = []
+        for filename in self._dirty:
+            data = getattr(self, filename).data
+            if filename == "config":  # the config is edited by hand, keep it readable
+                payloads.append((filename, json.dumps(data, indent=4)))
+            else:
+                payloads.append((filename, json.dumps(data, separators=(',', ':'))))
+        self._dirty.clear()
+        return self._generation, payloads
+
+    def _write(self, generation, payloads):
+        with self._write_lock:
+            for filename, text in payloads:
+                if self._written.get(filename, 0) > generation:
+                    continue  # a newer version was already written by a later flush
+                atomic_write(f"{self.storage_dir}/{filename}.json", text)
+                self._written[filename] = generation
+
+    async def flush(self):
+        """Write pending changes to disk without blocking the event loop, trying again later if that fails."""
+        generation, payloads = self._collect()
+        if not payloads:
+            return
         try:
-            data = self.cache.data
-            with open(f"{self.storage_dir}/cache.json", "w") as f:
-                json.dump(data, f, indent=4)
-        except AttributeError:
-            if self._initialized:
-                raise
+            await asyncio.get_running_loop().run_in_executor(None, self._write, generation, payloads)
+        except Exception as e:
+            logging.error("Couldn't write %s: %s", ', '.join(filename for filename, _ in payloads), e)
+            # the files that weren't written are still dirty, they are serialized again on the next flush
+            self._dirty.update(filename for filename, _ in payloads if self._written.get(filename, 0) < generation)
+            self._schedule_flush()
+
+    def flush_sync(self):
+        """Write pending changes to disk immediately, for use right before the process goes away."""
+        generation, payloads = self._collect()
+        if payloads:
+            self._write(generation, payloads)
 
 
 class Bot(commands.Bot, ABC):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, startup=None, **kwargs):
+        self.startup = startup or Startup()
+        # the config decides the intents and cache policy, so it is loaded before the client is set up
+        with self.startup.phase('storage load'):
+            self.storage = Storage()
+        self.lean = self.config.view('lean', False)
+        if self.lean:
+            kwargs.update(lean_options())
         super().__init__(*args, **kwargs)
         load_dotenv()
         self.token = os.getenv("BOT_TOKEN")
@@ -142,20 +523,182 @@ class Bot(commands.Bot, ABC):
         os.environ["JISHAKU_NO_UNDERSCORE"] = "True"
         os.environ['JISHAKU_RETAIN'] = "True"
         self.owner_id = None
-        self.storage = Storage()
         self.owner_ids = self.config.get('owner_ids', [690420846774321221, 556119013298667520])
-        self.load_extension('jishaku')
-        self.brainfuck = bftools.BrainfuckTools()
+        self.source_index = SourceIndex(self, 'https://github.com/Pycord-Development/robocord')
+        self.reloader = HotReloader(self)
+        # loaded once the bot is ready, or as soon as something needs them; see ensure_extension
+        self.lazy_extensions = ['jishaku', *self.config.get('lazy_cogs', [])]
+        self.bf_executor = BrainfuckExecutor(**self.config.view('bf', {}))
+        self.prefixes = Prefixes(self)
+        self.join_order = JoinOrder()
+        self.member_tables = MemberTables(self.join_order, lean=self.lean)
+        if self.lean:
+            self._hook_member_remove()
+        self.responses = ResponseCache()
+        self.rate_limiter = RateLimiter(self, size=self.config.view('ratelimit_buckets', 10000))
+        self.before_invoke(self.check_rate_limit)  # a global check would also run when help filters commands
+        self.edit_reinvoker = EditReinvoker(self, delay=self.config.view('edit_debounce', 1.0))
+        self.metrics = Metrics()
+        self.metrics.instrument_http(self.http)
+        self.lag_monitor = LagMonitor()
+        self.watchdog = Watchdog(threshold=self.config.view('watchdog_threshold', 0.5))
+        self.shutdown_hooks = [self.bf_executor.shutdown]  # coroutine functions awaited by prepare_shutdown
         self.hang = False
+        self._resumed_session = None
+        self._missed_joins = set()
 
     @property
     def config(self):
         return self.storage.config
 
+    def _hook_member_remove(self):
+        """
+        Without a member cache the library only dispatches member_remove for the few members it has cached,
+        so leavers are taken out of the member tables by id straight from the GUILD_MEMBER_REMOVE payload.
+        """
+        parsers = self._connection.parsers
+        parse = parsers['GUILD_MEMBER_REMOVE']
+
+        def parse_member_remove(data):
+            self.member_tables.remove_id(int(data['guild_id']), int(data['user']['id']))
+            parse(data)
+
+        parsers['GUILD_MEMBER_REMOVE'] = parse_member_remove
+
     @property
     def cache(self):
         return self.storage.cache
 
+    async def prepare_shutdown(self):
+        """Persist everything that is still pending, before the bot closes or the process is replaced."""
+        for hook in self.shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logging.error(e)
+        await self.storage.flush()
+        await self.storage.db.close()
+
+    async def close(self):
+        await self.prepare_shutdown()
+        await super().close()
+
+    async def load_lazy_extensions(self):
+        """Load the lazy extensions one at a time, giving the event loop a chance to run in between."""
+        timer = Timer()
+        for name in self.lazy_extensions:
+            if name not in self.extensions:
+                try:
+                    self.load_extension(name)
+                except discord.DiscordException as e:
+                    logging.error(e)
+            await asyncio.sleep(0)
+        self.startup.record('lazy extension load', timer.finish())
+
+    def ensure_extension(self, name):
+        """Load an extension now if it hasn't been yet, for commands that depend on a lazy extension."""
+        if name not in self.extensions:
+            self.load_extension(name)
+
+    async def login(self, token):
+        # once per process, before connecting, instead of on every ready
+        with self.startup.phase('db init'):
+            await self.storage.db.init()
+        self.dispatch("db_ready")
+        self._prepare_resume()
+        self.startup.begin('gateway ready')
+        await super().login(token)
+
+    @property
+    def snapshot_path(self):
+        return f"{self.storage.storage_dir}/members.snapshot"
+
+    def save_session(self):
+        """
+        Persist what the next process needs to resume this gateway session instead of identifying again,
+        along with the member tables. Call it last before the process is replaced, events after it are replayed.
+        Only lean mode resumes: without a member cache the member tables are all the state READY would bring
+        besides the guilds and channels, which restore_session_state fetches.
+        """
+        ws = self.ws
+        if not self.lean or ws is None or ws.session_id is None:
+            return False
+        if len(self.guilds) > self.config.view('resume_max_guilds', 100):
+            return False  # fetching that many guilds would be slower than identifying
+        url = str(getattr(ws, 'resume_gateway_url', None) or ws.gateway)
+        gateway = str(ws.gateway)
+        if '?' not in url and '?' in gateway:  # keep the encoding, version and compression parameters
+            url += gateway[gateway.index('?'):]
+        atomic_write(self.snapshot_path, pickle.dumps(self.member_tables.snapshot(), pickle.HIGHEST_PROTOCOL))
+        self.cache['resume_session'] = {
+            'session_id': ws.session_id,
+            'sequence': ws.sequence,
+            'url': url,
+            'guilds': [guild.id for guild in self.guilds],
+            'time': time.time(),
+        }
+        self.storage.flush_sync()
+        return True
+
+    def _prepare_resume(self):
+        session = self.cache.get('resume_session')
+        if session is None:
+            return
+        del self.cache['resume_session']
+        if not self.lean or time.time() - session['time'] > self.config.view('resume_max_age', 120):
+            return
+        missing = missing_internals(self)
+        if missing:
+            logging.error("Can't resume with this version of py-cord, it lacks %s", ', '.join(missing))
+            return
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                self.member_tables.restore(pickle.load(f))
+        except (OSError, pickle.UnpicklingError, KeyError) as e:
+            logging.error("Couldn't restore the member tables: %s", e)
+        self._resumed_session = session
+        self._missed_joins = track_missed_joins(self)
+        resume_once(self, session)
+
+    async def restore_session_state(self):
+        """
+        After resuming the previous process' session there is no READY, so the guild cache is empty, the bot
+        never becomes ready and the application commands are never synced. Fetch the guilds, their channels,
+        threads and the bot's member over HTTP instead, a few guilds at a time, then do what READY would have.
+        Returns whether this was such a resume.
+        """
+        session, self._resumed_session = self._resumed_session, None
+        if session is None or self.is_ready():
+            return False
+        state = self._connection
+        if state.user is None:
+            state.user = discord.ClientUser(state=state, data=await self.http.get_user('@me'))
+        limit = asyncio.Semaphore(self.config.view('resume_fetch_concurrency', 8))
+
+        async def restore(guild_id):
+            async with limit:
+                try:
+                    guild = await self.fetch_guild(guild_id)
+                    channels, threads, me = await asyncio.gather(
+                        guild.fetch_channels(), guild.active_threads(), guild.fetch_member(state.user.id))
+                except discord.HTTPException as e:
+                    logging.error("Couldn't fetch guild %s after resuming: %s", guild_id, e)
+                    return
+            for channel in channels:
+                guild._add_channel(channel)
+            for thread in threads:
+                guild._add_thread(thread)
+            guild._add_member(me)
+            state._add_guild(guild)
+
+        await asyncio.gather(*map(restore, session['guilds']))
+        for guild_id in self._missed_joins:
+            self.member_tables.discard(guild_id)  # loaded again when next needed
+        self._missed_joins = set()
+        self._ready.set()
+        self.dispatch('connect')  # registers and syncs the application commands
+        return True
+
     def run(self, *args, **kwargs):
         if len(args):
             super().run(*args, **kwargs)
@@ -165,7 +708,72 @@ class Bot(commands.Bot, ABC):
     async def get_application_context(
         self, interaction, cls=Context
     ):
-        return await super().get_application_context(interaction=interaction, cls=cls)
+        ctx = await super().get_application_context(interaction=interaction, cls=cls)
+        return ctx
+
+    def load_extension(self, name, *args, **kwargs):
+        timer = Timer()
+        result = super().load_extension(name, *args, **kwargs)
+        self.startup.extensions[name] = timer.finish()
+        self.reloader.track(name)
+        self.source_index.invalidate()
+        return result
+
+    def unload_extension(self, *args, **kwargs):
+        result = super().unload_extension(*args, **kwargs)
+        self.source_index.invalidate()
+        return result
+
+    def reload_extension(self, name, *args, **kwargs):
+        result = super().reload_extension(name, *args, **kwargs)
+        self.reloader.track(name)
+        self.source_index.invalidate()
+        return result
+
+    async def get_context(self, message, *, cls=PrefixContext):
+        return await super().get_context(message, cls=cls)
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        with self.metrics.measure(ctx.command.qualified_name, Timer()):
+            await super().invoke(ctx)
+
+    async def invoke_application_command(self, ctx):
+        with self.metrics.measure(ctx.command.qualified_name, Timer()):
+            await super().invoke_application_command(ctx)
+
+    async def check_rate_limit(self, ctx):
+        limit = ctx.rate_limit()
+        if limit:
+            bucket_type = commands.BucketType.user if limit.scope == 'user' else commands.BucketType.guild
+            raise commands.CommandOnCooldown(commands.Cooldown(limit.rate, limit.per), limit.retry_after, bucket_type)
+
+    @staticmethod
+    def _has_own_error_handler(context):
+        return context.command.has_error_handler() or (context.cog is not None and context.cog.has_error_handler())
+
+    async def on_command_error(self, context, exception):
+        if isinstance(exception, commands.CommandOnCooldown):
+            if self._has_own_error_handler(context):
+                return
+            return await context.send(f"Error: Slow down, try again in {exception.retry_after:.1f}s.")
+        if context.command is not None:
+            self.metrics.error(context.command.qualified_name)
+        await super().on_command_error(context, exception)
+
+    async def on_application_command_error(self, context, exception):
+        if isinstance(exception, commands.CommandOnCooldown):
+            if self._has_own_error_handler(context):
+                return
+            return await context.respond(f"Error: Slow down, try again in {exception.retry_after:.1f}s.",
+                                         ephemeral=True)
+        self.metrics.error(context.command.qualified_name)
+        await super().on_application_command_error(context, exception)
+
+    async def on_db_ready(self):
+        for connection in self.storage.db.connections():
+            self.metrics.instrument_db(connection)
 
 
 def escape(text):
@@ -176,23 +784,35 @@ def codeblock(code, lang="py"):
     return f"```{lang}\n{escape(code)}\n```"
 
 
-def codefile(code, filename=None, ext="py"):
+def codefile(code, filename=None, ext="py", compress=False):
     if filename is None:
         filename = f"code.{ext}"
-    data = io.BytesIO(bytes(code, encoding='utf8'))
-    return discord.File(data, filename)
+    data = code.encode('utf8') if isinstance(code, str) else code
+    if compress:
+        data = gzip.compress(data)
+        filename += ".gz"
+    return discord.File(io.BytesIO(data), filename)
 
 
-async def send_code(ctx, code, lang="py", filename=None, ext=None):
-    cb = codeblock(code, lang=lang)
-    if len(cb) < 500:  # max is 2000 but using 500 minimizes flood
-        return await ctx.respond(cb, allowed_mentions=discord.AllowedMentions.none())
-    else:
-        if ext is None:
-            ext = lang
-        cf = codefile(code, filename=filename, ext=ext)
-        await ctx.send(file=cf)
-        await ctx.respond("Text was too long to put in a codeblock, used file instead")
+async def send_code(ctx, code, lang="py", filename=None, ext=None, gzip_threshold=None):
+    # a codeblock is always at least this long, so skip building it for output that can't fit anyway
+    if len(code) + len(lang) + 8 < 500:
+        cb = codeblock(code, lang=lang)
+        if len(cb) < 500:  # max is 2000 but using 500 minimizes flood
+            return await ctx.respond(cb, allowed_mentions=discord.AllowedMentions.none())
+    if ext is None:
+        ext = lang
+    if gzip_threshold is None:
+        gzip_threshold = ctx.bot.config.view('gzip_threshold', 1024 * 1024)
+    data = code.encode('utf8')
+    compress = len(data) > gzip_threshold
+    # attach the file to the response itself instead of sending it separately
+    await ctx.respond(
+        "Text was too long to put in a codeblock, used a compressed file instead" if compress
+        else "Text was too long to put in a codeblock, used file instead",
+        file=codefile(data, filename=filename, ext=ext, compress=compress),
+        allowed_mentions=discord.AllowedMentions.none()
+    )
 
 
 class Timer:
@@ -213,27 +833,301 @@ class Timer:
         return self.duration
 
 
-async def get_prefix(bot, message):
-    # TODO: custom prefixes
-    return commands.when_mentioned_or(bot.config.get('prefix', ';'))(bot, message)
+class Prefixes:
+    """
+    Per-guild command prefixes, stored in the config under "prefixes" and keyed by guild id.
+    Guilds without custom prefixes (and DMs) use the global "prefix".
+    The full prefix tuple, mentions included, is computed once per guild and reused until the config changes.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self._resolved = {}
+        self._version = None
 
+    def get(self, guild_id):
+        custom = self.bot.config.view('prefixes', {}).get(str(guild_id)) if guild_id else None
+        if custom:
+            return custom
+        default = self.bot.config.view('prefix', ';')
+        return (default,) if isinstance(default, str) else default
 
-class Tag(Model):
-    name = fields.CharField(null=False, max_length=100)
-    guild = fields.IntField(null=False)
-    author = fields.IntField(null=False)
-    content = fields.CharField(null=False, max_length=2000)
-    created = fields.DatetimeField(auto_now_add=True, null=False)
-    edited = fields.DatetimeField(auto_now=True, null=False)
-    uses = fields.IntField(null=False, default=0)
+    def set(self, guild_id, prefixes):
+        data = self.bot.config.get('prefixes', {})
+        if prefixes:
+            data[str(guild_id)] = list(prefixes)
+        else:
+            data.pop(str(guild_id), None)
+        self.bot.config['prefixes'] = data
+
+    def resolve(self, guild_id):
+        if self._version != self.bot.config.version:
+            self._resolved.clear()
+            self._version = self.bot.config.version
+        try:
+            return self._resolved[guild_id]
+        except KeyError:
+            pass
+        user_id = self.bot.user.id
+        # same order as commands.when_mentioned_or
+        resolved = self._resolved[guild_id] = (f'<@{user_id}> ', f'<@!{user_id}> ', *self.get(guild_id))
+        return resolved
 
-    def raw_content(self):
-        return discord.utils.escape_markdown(self.content)
 
+class SourceIndex:
+    """
+    Maps the full name of every slash, context menu and prefix command to the GitHub URL of its source.
+    It is built once and rebuilt after extensions change, so /source never has to read source files.
+    """
+    def __init__(self, bot, url, branch='main'):
+        self.bot = bot
+        self.url = url
+        self.branch = branch
+        self.root = os.path.dirname(os.path.abspath(__file__))
+        self._entries = None  # full name -> url
+        self._groups = set()
+        self._names = []  # sorted lowercase names for autocomplete
 
-class Lowercase:
-    def __init__(self):
-        pass
+    def invalidate(self):
+        self._entries = None
+
+    def _location(self, callback):
+        code = callback.__code__
+        path = os.path.relpath(code.co_filename, self.root)
+        if path.startswith('..'):
+            return None  # not part of this repository, e.g. jishaku
+        lines, first = inspect.getsourcelines(code)
+        return f"{self.url}/blob/{self.branch}/{path.replace(os.sep, '/')}#L{first}-L{first + len(lines) - 1}"
+
+    def build(self):
+        entries = {}
+        groups = set()
+        stack = [(command, command.name) for command in self.bot.pending_application_commands]
+        while stack:
+            command, name = stack.pop()
+            if isinstance(command, discord.SlashCommandGroup):
+                groups.add(name)
+                stack.extend((sub, f"{name} {sub.name}") for sub in command.subcommands)
+            else:
+                location = self._location(command.callback)
+                if location:
+                    entries[name] = location
+        for command in self.bot.walk_commands():
+            if isinstance(command, commands.Group):
+                groups.add(command.qualified_name)
+            location = self._location(command.callback)
+            if location:
+                entries.setdefault(command.qualified_name, location)
+        self._groups = groups - entries.keys()
+        self._names = sorted((name.lower(), name) for name in entries)
+        self._entries = entries
+
+    def get(self, name):
+        """The URL for a command, None if there's no such command and False if it is a group."""
+        if self._entries is None:
+            self.build()
+        name = ' '.join(name.split())
+        url = self._entries.get(name)
+        if url is None:
+            # names are matched case-insensitively for prefix commands
+            index = bisect.bisect_left(self._names, (name.lower(),))
+            if index < len(self._names) and self._names[index][0] == name.lower():
+                url = self._entries[self._names[index][1]]
+        if url is None and name in self._groups:
+            return False
+        return url
+
+    def search(self, prefix, limit=25):
+        if self._entries is None:
+            self.build()
+        prefix = prefix.lower()
+        index = bisect.bisect_left(self._names, (prefix,))
+        results = []
+        for key, name in self._names[index:index + limit]:
+            if not key.startswith(prefix):
+                break
+            results.append(name)
+        return results
+
+
+class HotReloader:
+    """
+    Tracks the source files of loaded extensions by mtime, size and hash, so that only changed extensions get reloaded.
+    Extensions importing a changed extension are reloaded after it, since they hold on to its old module.
+    Other project modules can't be replaced in a running bot, changes to them are reported as needing a restart.
+    """
+    def __init__(self, bot, root=None):
+        self.bot = bot
+        self.root = root or os.path.dirname(os.path.abspath(__file__))
+        self.timings = {}  # extension -> seconds its last reload took
+        self._fingerprints = {}  # path -> (mtime_ns, size, sha1)
+        self._imports = {}  # path -> (sha1, names of the modules it imports)
+        self._task = None
+        for path in self._project_files().values():
+            self._fingerprints[path] = self._fingerprint(path)
+
+    def _project_files(self):
+        """Module name -> source path, for every imported module that is part of the project."""
+        files = {}
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, '__file__', None)
+            if path and path.endswith('.py'):
+                path = os.path.abspath(path)
+                if path.startswith(self.root + os.sep):
+                    files[name] = path
+        return files
+
+    @staticmethod
+    def _fingerprint(path, previous=None):
+        stat = os.stat(path)
+        if previous is not None and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+            return previous
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        return stat.st_mtime_ns, stat.st_size, digest
+
+    @staticmethod
+    def _owner(module_name, extensions):
+        for extension in extensions:
+            if module_name == extension or module_name.startswith(extension + '.'):
+                return extension
+        return None
+
+    def track(self, name):
+        """Record the files of an extension as they are now, after it was loaded or reloaded."""
+        for module_name, path in self._project_files().items():
+            if self._owner(module_name, (name,)):
+                self._fingerprints[path] = self._fingerprint(path)
+
+    def scan(self):
+        """Returns the extensions whose files changed, and the other project modules that changed."""
+        extensions = list(self.bot.extensions)
+        changed, modules = set(), []
+        for module_name, path in self._project_files().items():
+            previous = self._fingerprints.get(path)
+            try:
+                current = self._fingerprints[path] = self._fingerprint(path, previous)
+            except FileNotFoundError:
+                continue
+            if previous is None or current[2] == previous[2]:
+                continue
+            extension = self._owner(module_name, extensions)
+            if extension is not None:
+                changed.add(extension)
+            else:
+                modules.append(os.path.relpath(path, self.root))
+        return changed, modules
 
-    async def convert(self, text):
-        return text.lower()
+    def _imported(self, module_name, path):
+        digest = self._fingerprint(path, self._fingerprints.get(path))[2]
+        cached = self._imports.get(path)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), path)
+        except SyntaxError:  # reloading it will fail and report the error
+            return set()
+        package = module_name if path.endswith('__init__.py') else module_name.rpartition('.')[0]
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ''
+                if node.level:
+                    base = importlib.util.resolve_name('.' * node.level + base, package)
+                names.add(base)
+                names.update(f"{base}.{alias.name}" for alias in node.names)
+        self._imports[path] = (digest, names)
+        return names
+
+    def dependencies(self):
+        """Extension -> the other loaded extensions it imports."""
+        extensions = list(self.bot.extensions)
+        dependencies = {name: set() for name in extensions}
+        for module_name, path in self._project_files().items():
+            extension = self._owner(module_name, extensions)
+            if extension is None:
+                continue
+            for imported in self._imported(module_name, path):
+                owner = self._owner(imported, extensions)
+                if owner is not None and owner != extension:
+                    dependencies[extension].add(owner)
+        return dependencies
+
+    def plan(self, changed):
+        """The changed extensions and everything depending on them, each one after its dependencies."""
+        dependencies = self.dependencies()
+        todo = set(changed) & set(dependencies)
+        while True:
+            dependents = {name for name, imported in dependencies.items() if imported & todo} - todo
+            if not dependents:
+                break
+            todo |= dependents
+        order = []
+
+        def visit(name, path):
+            if name in order or name in path:  # already planned, or an import cycle
+                return
+            for dependency in sorted(dependencies[name] & todo):
+                visit(dependency, path + (name,))
+            order.append(name)
+
+        for name in sorted(todo):
+            visit(name, ())
+        return order
+
+    def reload(self, names):
+        """Reload extensions in the given order, returns (name, seconds, error or None) for each of them."""
+        results = []
+        for name in names:
+            timer = Timer()
+            try:
+                self.bot.reload_extension(name)
+            except discord.DiscordException as e:
+                results.append((name, timer.finish(), e))
+            else:
+                self.timings[name] = timer.finish()
+                results.append((name, timer.duration, None))
+        return results
+
+    def reload_changed(self):
+        """Reload the changed extensions, returns their results and the changed modules that need a restart."""
+        changed, modules = self.scan()
+        return self.reload(self.plan(changed)), modules
+
+    @staticmethod
+    def format(results):
+        return '\n'.join(
+            f"\U00002705{name} ({duration * 1000:.0f}ms)" if error is None else f"\U0000274c{name}: {error}"
+            for name, duration, error in results
+        )
+
+    def start_watching(self, interval=1.0):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._watch(interval))
+
+    def stop_watching(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                results, modules = self.reload_changed()
+            except Exception:
+                logging.exception("Hot reload failed")
+                continue
+            for name, duration, error in results:
+                if error is None:
+                    logging.info("Reloaded %s in %.0fms", name, duration * 1000)
+                else:
+                    logging.error("Failed to reload %s: %s", name, error)
+            if modules:
+                logging.warning("Changed modules need a restart: %s", ', '.join(modules))
+
+
+async def get_prefix(bot, message):
+    return bot.prefixes.resolve(message.guild.id if message.guild else None)